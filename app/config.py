@@ -17,11 +17,21 @@ DB_POOL_SIZE = 10
 DB_MAX_OVERFLOW = 20
 DB_POOL_RECYCLE = 3600  # 1 hour
 DB_CONNECT_TIMEOUT = 10
+# In-process cache for raw-data lookups by unique ID (hits and misses)
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", 10000))
+RECORD_CACHE_TTL = int(os.getenv("RECORD_CACHE_TTL", 300))  # seconds
 
 # ==================== UPLOAD SETTINGS ====================
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
-ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+# The formats the processing pipeline reads; every upload path accepts these
+# and the scheduler picks up only these from a report folder
+ALLOWED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 UPLOAD_DIR = "uploaded_reports"
+UPLOAD_SWEEP_INTERVAL = 300  # seconds between checks for abandoned upload sessions
+# Resumable upload sessions with no chunk or request for this long are closed:
+# the report is sealed with the files that completed and partial files are
+# deleted (the report too, if no file ever completed).
+UPLOAD_SESSION_IDLE_TIMEOUT = int(os.getenv("UPLOAD_SESSION_IDLE_TIMEOUT", 24 * 3600))  # seconds
 EXCEL_EXPORT_TEMP_DIR = "temp/exports"
 PDF_TEMP_DIR = "temp/pdfs"
 
@@ -115,10 +125,134 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 # ==================== AWS S3 ====================
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET", "asrs-bucket")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+# Shared uploader: one client whose HTTP pool covers every concurrent upload
+# (8 pipeline upload workers x S3_TRANSFER_CONCURRENCY parts), multipart
+# above S3_MULTIPART_THRESHOLD.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", 4))  # parts in flight per upload
+S3_UPLOAD_RETRIES = 3
+S3_RETRY_BACKOFF = 0.5  # seconds, doubled after each failed attempt
+# Local S3 stand-in (MinIO, moto server); unset for AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+# Direct-to-S3 uploads: the reports page gets presigned multipart URLs and the
+# browser PUTs parts (S3_MULTIPART_CHUNKSIZE each) straight to the bucket.
+# The bucket's CORS rules must allow PUT from the app origin and expose ETag.
+DIRECT_S3_UPLOAD = os.getenv("DIRECT_S3_UPLOAD", "false").lower() == "true"
+DIRECT_UPLOAD_URL_EXPIRY = int(os.getenv("DIRECT_UPLOAD_URL_EXPIRY", 3600))  # seconds
+# A direct upload with no request for this long (tab closed, browser gone) is
+# finalized by the server: its report is sealed with the files that finished
+# and unfinished S3 multipart uploads are aborted.
+DIRECT_UPLOAD_IDLE_TIMEOUT = int(os.getenv("DIRECT_UPLOAD_IDLE_TIMEOUT", DIRECT_UPLOAD_URL_EXPIRY))  # seconds
 
 # ==================== WORKER SETTINGS ====================
-UPLOAD_EXECUTOR_MAX_WORKERS = 4
-UPLOAD_EXECUTOR_THREAD_PREFIX = "upload_worker_"
+# Global report scheduler used by every upload endpoint: at most
+# SCHEDULER_MAX_IMAGES_IN_FLIGHT images (all users together) are in the
+# pipeline at once, users take turns image by image, and at most
+# SCHEDULER_MAX_ACTIVE_REPORTS reports are admitted at a time.
+SCHEDULER_MAX_IMAGES_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IMAGES_IN_FLIGHT", 64))
+SCHEDULER_MAX_ACTIVE_REPORTS = int(os.getenv("SCHEDULER_MAX_ACTIVE_REPORTS", 100))
+
+# ==================== DETECTION SETTINGS ====================
+# Size of the app-lifetime detection process pool shared by every report.
+# Each worker holds one copy of the YOLO model, so RAM scales with this value.
+DETECTION_POOL_WORKERS = int(os.getenv("DETECTION_POOL_WORKERS", 2))
+DETECTION_MODEL_PATH = os.getenv("DETECTION_MODEL_PATH", "trained_models/esrsyolo11 1.pt")
+# Images from all running reports are grouped into one model.predict() call
+# of up to DETECTION_BATCH_SIZE images, waiting at most DETECTION_BATCH_WAIT_MS.
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 8))
+DETECTION_BATCH_WAIT_MS = int(os.getenv("DETECTION_BATCH_WAIT_MS", 50))
+# Inference backend for the detector: "torch" runs the .pt weights directly,
+# "onnx" (ONNX Runtime) and "openvino" run a CPU export of the same weights,
+# created next to DETECTION_MODEL_PATH on first use.
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "torch").lower()
+# "onnx-int8" runs an INT8-quantized ONNX model built by quantize_detection.py;
+# it only loads after that script's accuracy gate has passed, i.e. precision
+# and recall drift against FP32 are all within DETECTION_INT8_MAX_DRIFT.
+DETECTION_INT8_MAX_DRIFT = float(os.getenv("DETECTION_INT8_MAX_DRIFT", 0.02))
+# Cascade mode: predict at DETECTION_CASCADE_IMGSZ first and re-run at
+# DETECTION_FULL_IMGSZ only for ambiguous images, i.e. the best Chassis
+# confidence is within DETECTION_CASCADE_CONF_BAND of CONF_THERSHOLD, or a
+# candidate box's area is within DETECTION_CASCADE_AREA_BAND (a fraction)
+# of AREA_THERSHOLD.
+DETECTION_CASCADE = os.getenv("DETECTION_CASCADE", "false").lower() == "true"
+DETECTION_CASCADE_IMGSZ = int(os.getenv("DETECTION_CASCADE_IMGSZ", 320))
+DETECTION_FULL_IMGSZ = int(os.getenv("DETECTION_FULL_IMGSZ", 640))
+DETECTION_CASCADE_CONF_BAND = float(os.getenv("DETECTION_CASCADE_CONF_BAND", 0.15))
+DETECTION_CASCADE_AREA_BAND = float(os.getenv("DETECTION_CASCADE_AREA_BAND", 0.2))
+# Part of the result-cache key: bump when the weights change under the same path
+DETECTION_MODEL_VERSION = os.getenv(
+    "DETECTION_MODEL_VERSION",
+    os.path.basename(DETECTION_MODEL_PATH) + ("" if DETECTION_BACKEND == "torch" else f"+{DETECTION_BACKEND}")
+)
+
+# ==================== RESULT CACHE SETTINGS ====================
+# Identical images (same content hash, model version and thresholds) reuse
+# the stored OCR IDs, detection outcome and S3 object instead of reprocessing.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 100000))
+RESULT_CACHE_MAX_AGE_DAYS = int(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", 30))
+RESULT_CACHE_EVICT_EVERY = 500  # run eviction after this many stores
+
+# ==================== RESULT WRITER SETTINGS ====================
+# Inference rows from all running reports are written with one multi-row
+# INSERT every INFERENCE_WRITER_FLUSH_ROWS rows or INFERENCE_WRITER_FLUSH_MS.
+INFERENCE_WRITER_FLUSH_ROWS = int(os.getenv("INFERENCE_WRITER_FLUSH_ROWS", 200))
+INFERENCE_WRITER_FLUSH_MS = int(os.getenv("INFERENCE_WRITER_FLUSH_MS", 250))
+
+# ==================== PIPELINE SETTINGS ====================
+# Images flow through these stages; each stage has its own worker threads
+# and a bounded input queue (backpressure keeps memory flat). OCR and detect
+# workers block on their batchers, so they need at least a batch's worth.
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 32))
+PIPELINE_STAGE_WORKERS = {
+    "prepare": 4,     # open/hash image, result-cache lookup (MySQL)
+    "ocr": 32,        # Google Vision
+    "lookup": 4,      # raw-data records (MySQL)
+    "detect": DETECTION_BATCH_SIZE * DETECTION_POOL_WORKERS,  # CPU, detection pool
+    "upload": 8,      # S3
+    "db": 2,          # hand rows to the group-commit writer
+}
+# Detection-first mode: run detection before OCR and skip Vision (and the
+# raw-data lookup) for images with no qualifying Chassis box (Empty Skid).
+# Off by default because it changes stored results: an Empty Skid image is
+# saved as a single row with no UNIQUE_ID/VIN_NO instead of one row per
+# sticker read, so searches and exports can no longer tell which slot was empty.
+PIPELINE_DETECTION_FIRST = os.getenv("PIPELINE_DETECTION_FIRST", "false").lower() == "true"
+
+# ==================== OCR SETTINGS ====================
+# In batch mode, images waiting for OCR are grouped into batch_annotate_images
+# calls of up to OCR_BATCH_SIZE images (Vision allows at most 16), flushed
+# after OCR_BATCH_FLUSH_MS even if the batch is not full.
+OCR_BATCH_MODE = os.getenv("OCR_BATCH_MODE", "true").lower() == "true"
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", 16))
+OCR_BATCH_FLUSH_MS = int(os.getenv("OCR_BATCH_FLUSH_MS", 100))
+OCR_BATCH_MAX_BYTES = 30 * 1024 * 1024  # total image bytes per batch request
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", 4))  # batch RPCs in flight
+# Payload policy: send the original file bytes when they are within these
+# limits, otherwise a JPEG resized to OCR_MAX_EDGE at OCR_JPEG_QUALITY.
+OCR_MAX_PAYLOAD_BYTES = int(os.getenv("OCR_MAX_PAYLOAD_BYTES", 10 * 1024 * 1024))
+OCR_MAX_PIXELS = 75_000_000  # Vision rejects larger images
+OCR_MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", 4000))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", 90))
+# Crop mode (needs PIPELINE_DETECTION_FIRST): send only the detected Chassis
+# boxes, each grown by OCR_CROP_MARGIN of its size per side, packed into one
+# mosaic image. Falls back to the full frame when the crops would cover more
+# than OCR_CROP_MAX_FRACTION of it.
+OCR_CROP_TO_DETECTIONS = os.getenv("OCR_CROP_TO_DETECTIONS", "false").lower() == "true"
+OCR_CROP_MARGIN = float(os.getenv("OCR_CROP_MARGIN", 0.25))
+OCR_CROP_MAX_FRACTION = 0.8
+# Progressive mode: OCR a JPEG downscaled to OCR_PROGRESSIVE_MAX_EDGE first and
+# only send full resolution when no well-formed @XX9999 ID is found in it.
+OCR_PROGRESSIVE = os.getenv("OCR_PROGRESSIVE", "false").lower() == "true"
+OCR_PROGRESSIVE_MAX_EDGE = int(os.getenv("OCR_PROGRESSIVE_MAX_EDGE", 1600))
+# Decode sticker QR codes locally (OpenCV) first; Vision only runs for images
+# where no sticker QR decodes. QR stickers also carry the VIN, so those IDs
+# skip the raw-data lookup.
+OCR_QR_FIRST = os.getenv("OCR_QR_FIRST", "true").lower() == "true"
+# host:port of a local fake Vision gRPC endpoint (plaintext, no credentials)
+VISION_EMULATOR_HOST = os.getenv("VISION_EMULATOR_HOST")
 
 # ==================== DISPLAY SETTINGS ====================
 ITEMS_PER_PAGE = 20
@@ -129,6 +263,9 @@ SEARCH_RESULTS_PER_PAGE = 20
 QR_CODE_SIZE = 4  # inches
 QR_MODULE_DRAW_TYPE = "rect"
 QR_BOX_SIZE = 10
+# Payload written into new stickers: "compact" (versioned, with checksum) or
+# "legacy" ("VIN NO: ... UNIQUE ID: ..."). Both are always decoded.
+QR_PAYLOAD_FORMAT = os.getenv("QR_PAYLOAD_FORMAT", "compact").lower()
 
 # ==================== EXCEL EXPORT ====================
 EXCEL_COLUMN_WIDTHS = {
@@ -0,0 +1,219 @@
+"""
+Direct-to-S3 uploads from the browser.
+
+The reports page asks for a direct upload: the report is created and opened
+in the scheduler, and every file gets an S3 multipart upload with one
+presigned URL per part. The browser PUTs the parts straight to the bucket
+(or a local stand-in such as MinIO via S3_ENDPOINT_URL), so image bytes never
+pass through this server on the way in. When a file's parts are done the
+browser reports their ETags; the multipart upload is completed, the object
+is fetched for the pipeline and queued for processing right away, and the
+pipeline reuses its S3 key instead of uploading it again. The pipeline
+reads images from local files (mmap, shared-memory pixels for detection),
+so that fetch is still one local write per image.
+
+Sessions are kept in memory: an interrupted direct upload is re-done
+rather than resumed after a restart (the resumable endpoints cover that).
+A session left idle for DIRECT_UPLOAD_IDLE_TIMEOUT is finalized by a
+background sweep, so an abandoned upload never holds its scheduler slot
+or leaves multipart uploads behind.
+"""
+
+import os
+import math
+import time
+import uuid
+import shutil
+import logging
+import threading
+
+from app.config import (
+    UPLOAD_DIR, S3_MULTIPART_CHUNKSIZE, DIRECT_UPLOAD_URL_EXPIRY, DIRECT_UPLOAD_IDLE_TIMEOUT, UPLOAD_SWEEP_INTERVAL
+)
+from app.upload_stream import UploadRejected, check_declared_upload, unique_name
+from backend.services.data_manager import create_report, delete_report
+from backend.services.s3_operator import get_uploader, make_object_key
+from backend.services.scheduler import SchedulerFullError
+
+logger = logging.getLogger(__name__)
+
+
+class DirectUploadStore:
+    """Presigns, completes and finalizes direct-to-S3 uploads for the upload endpoints."""
+
+    def __init__(self, scheduler, idle_timeout=DIRECT_UPLOAD_IDLE_TIMEOUT):
+        self.scheduler = scheduler
+        self.idle_timeout = idle_timeout
+        self._sessions = {}  # upload_id -> session dict
+        self._lock = threading.Lock()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="direct_upload_sweeper", daemon=True)
+        self._sweeper.start()
+
+    def create(self, user_id, report_name, files):
+        """
+        Open a report for `files` ([{"filename", "size", "content_type"}]) and
+        return the presigned part URLs for each of them.
+        """
+        if not files:
+            raise UploadRejected("At least one file is required")
+        checked = [
+            (check_declared_upload(f.get("filename", ""), f.get("size")), f.get("size"), f.get("content_type"))
+            for f in files
+        ]
+
+        report_id = create_report(report_name, user_id)
+        upload_id = uuid.uuid4().hex
+        safe_name = "".join([c if c.isalnum() or c in ('-', '_') else '_' for c in report_name])
+        report_dir = os.path.join(UPLOAD_DIR, f"{safe_name}_{upload_id[:8]}")
+        try:
+            run = self.scheduler.open_report(report_dir, report_id, user_id)
+        except SchedulerFullError:
+            delete_report(report_id)
+            raise
+
+        uploader = get_uploader()
+        session = {"user_id": user_id, "report_id": report_id, "run": run, "files": {},
+                   "cond": threading.Condition(), "completing": 0, "sealed": False,
+                   "touched": time.monotonic()}
+        response_files, local_names = [], set()
+        try:
+            for filename, size, content_type in checked:
+                s3_key = make_object_key(filename)
+                s3_upload_id = uploader.create_multipart(s3_key, content_type)
+                part_count = max(1, math.ceil(size / S3_MULTIPART_CHUNKSIZE))
+                file_id = uuid.uuid4().hex
+                # Repeated names get a suffix so each file has its own local path
+                local_name = unique_name(filename, local_names)
+                local_names.add(local_name)
+                session["files"][file_id] = {"filename": filename, "local_name": local_name, "size": size,
+                                             "s3_key": s3_key, "s3_upload_id": s3_upload_id, "complete": False}
+                response_files.append({
+                    "file_id": file_id,
+                    "filename": filename,
+                    "parts": [
+                        {"part_number": n,
+                         "url": uploader.presign_part(s3_key, s3_upload_id, n, DIRECT_UPLOAD_URL_EXPIRY)}
+                        for n in range(1, part_count + 1)
+                    ],
+                })
+        except Exception:
+            self._abort_incomplete(session)
+            self.scheduler.seal_report(run)
+            delete_report(report_id)
+            raise
+
+        with self._lock:
+            self._sessions[upload_id] = session
+        logger.info(f"User {user_id}: Direct S3 upload {upload_id} opened for report {report_id} "
+                    f"({len(checked)} files)")
+        return {"upload_id": upload_id, "report_id": report_id,
+                "part_size": S3_MULTIPART_CHUNKSIZE, "files": response_files}
+
+    def get(self, upload_id, user_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None or session["user_id"] != user_id:
+            return None
+        session["touched"] = time.monotonic()
+        return session
+
+    def complete_file(self, session, file_id, parts):
+        """
+        Complete one file's multipart upload from the browser's
+        [(part_number, etag)] list, fetch the object and queue it for processing.
+        """
+        info = session["files"].get(file_id)
+        if info is None:
+            raise KeyError(file_id)
+        with session["cond"]:
+            if session["sealed"]:
+                raise UploadRejected("Upload already finalized")
+            if info["complete"] or info.get("completing"):
+                return
+            info["completing"] = True
+            session["completing"] += 1
+
+        try:
+            uploader = get_uploader()
+            uploader.complete_multipart(info["s3_key"], info["s3_upload_id"], parts)
+            # The pipeline works on local bytes (mmap/decode once); fetch the object
+            run = session["run"]
+            os.makedirs(run.report_dir, exist_ok=True)
+            path = os.path.join(run.report_dir, info["local_name"])
+            uploader.download(info["s3_key"], path)
+            self.scheduler.add_image(run, path, s3_key=info["s3_key"])
+            info["complete"] = True
+        finally:
+            with session["cond"]:
+                info["completing"] = False
+                session["completing"] -= 1
+                session["cond"].notify_all()
+
+    def finalize(self, upload_id, session):
+        """
+        Seal the report once in-flight completions are done; files never
+        completed are aborted in S3. Returns a summary.
+        """
+        with self._lock:
+            if self._sessions.pop(upload_id, None) is None:
+                raise UploadRejected("Upload already finalized")
+        with session["cond"]:
+            session["sealed"] = True
+            while session["completing"]:
+                session["cond"].wait()
+        aborted = self._abort_incomplete(session)
+        self.scheduler.seal_report(session["run"])
+        completed = sum(1 for info in session["files"].values() if info["complete"])
+        if not completed:
+            delete_report(session["report_id"])
+            shutil.rmtree(session["run"].report_dir, ignore_errors=True)
+            raise UploadRejected("No file finished uploading")
+        logger.info(f"User {session['user_id']}: Direct S3 upload {upload_id} finalized, "
+                    f"{completed} files ({len(aborted)} aborted)")
+        return {"report_id": session["report_id"], "completed": completed, "aborted": aborted}
+
+    def expire_idle(self):
+        """Finalize every session idle for longer than `idle_timeout`."""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [(upload_id, session) for upload_id, session in self._sessions.items()
+                     if session["touched"] < deadline and not session["completing"]]
+        for upload_id, session in stale:
+            logger.warning(f"User {session['user_id']}: Direct S3 upload {upload_id} abandoned, finalizing")
+            try:
+                self.finalize(upload_id, session)
+            except UploadRejected as e:
+                logger.info(f"Direct S3 upload {upload_id}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Could not finalize abandoned direct upload {upload_id}: {str(e)}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(UPLOAD_SWEEP_INTERVAL)
+            self.expire_idle()
+
+    @staticmethod
+    def _abort_incomplete(session):
+        uploader = get_uploader()
+        aborted = []
+        for info in session["files"].values():
+            if info["complete"]:
+                continue
+            try:
+                uploader.abort_multipart(info["s3_key"], info["s3_upload_id"])
+            except Exception as e:
+                logger.warning(f"Could not abort multipart upload {info['s3_key']}: {str(e)}")
+            aborted.append(info["filename"])
+        return aborted
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_direct_uploads(scheduler):
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DirectUploadStore(scheduler)
+        return _store
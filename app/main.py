@@ -3,10 +3,14 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
-from concurrent.futures import ThreadPoolExecutor
 import os
 import logging
 
+from backend.services.detection_pool import get_detection_pool, shutdown_detection_pool
+from backend.services.result_writer import shutdown_inference_writer
+from backend.services.pipeline import shutdown_pipeline
+from backend.services.scheduler import get_scheduler, shutdown_scheduler
+from app.resumable_upload import get_upload_sessions
 from .routers import dashboard, reports, upload, visualize, auth_routes, qr_generation, settings, search
 
 logger = logging.getLogger(__name__)
@@ -18,13 +22,9 @@ app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 templates = Jinja2Templates(directory="app/templates")
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Global ThreadPoolExecutor for managing concurrent user uploads
-# Max 4 users can have their reports processing simultaneously
-# Within each user's task, images process sequentially
-app.state.upload_executor = ThreadPoolExecutor(
-    max_workers=4,
-    thread_name_prefix="upload_worker_"
-)
+# Global report scheduler shared by /upload and /reports/create:
+# one image-concurrency budget, per-user round-robin fairness
+app.state.scheduler = get_scheduler()
 
 # Include routers
 app.include_router(auth_routes.router)
@@ -43,10 +43,22 @@ def root(request: Request):
         return RedirectResponse("/dashboard")
     return RedirectResponse("/login")
 
+@app.on_event("startup")
+def start_processing():
+    """Warm up detection workers, then resume reports interrupted by the last shutdown"""
+    get_detection_pool().warm_up()
+    try:
+        app.state.scheduler.resume_unfinished()
+    except Exception as e:
+        logger.error(f"Could not resume unfinished reports: {str(e)}")
+    # Starts the sweep that expires resumable uploads abandoned before a restart
+    get_upload_sessions(app.state.scheduler)
+
 @app.on_event("shutdown")
-def shutdown_executor():
-    """Gracefully shutdown the upload executor on app shutdown"""
-    logger.info("Shutting down upload executor...")
-    app.state.upload_executor.shutdown(wait=True)
-    logger.info("Upload executor shutdown complete")
+def shutdown_processing():
+    """Gracefully stop the scheduler and processing services on app shutdown"""
+    shutdown_scheduler()
+    shutdown_pipeline()
+    shutdown_detection_pool()
+    shutdown_inference_writer()
 
@@ -0,0 +1,314 @@
+"""
+Resumable chunked uploads.
+
+A client opens an upload session for a report, registers each file with its
+size, then PUTs the bytes in chunks at explicit offsets. After a dropped
+connection it asks for the current offset and continues from there. Chunks
+are appended to a .part file on local disk, so offsets also survive a server
+restart. Each file goes to the report's processing pipeline as soon as its
+last byte lands; finalizing the session seals the report.
+
+Session state lives in <UPLOAD_DIR>/.sessions/<upload_id>/session.json.
+Sessions idle for UPLOAD_SESSION_IDLE_TIMEOUT (judged by the newest file in
+the session folder, so it holds across restarts) are expired by a
+background sweep.
+"""
+
+import os
+import json
+import uuid
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+
+from app.config import UPLOAD_DIR, UPLOAD_SESSION_IDLE_TIMEOUT, UPLOAD_SWEEP_INTERVAL
+from app.upload_stream import UploadRejected, check_declared_upload, unique_name
+from backend.services.data_manager import create_report, delete_report
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = os.path.join(UPLOAD_DIR, ".sessions")
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for the wrong offset; `offset` is where the file actually is"""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+class UploadSession:
+    """One resumable upload: a report plus the files being uploaded into it."""
+
+    def __init__(self, upload_id, user_id, report_id, report_name, files=None, generation=0):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.report_id = report_id
+        self.report_name = report_name
+        # file_id -> {"filename", "size", "complete"}
+        self.files = files or {}
+        # Bumped whenever a new scheduler run is opened (e.g. after a restart),
+        # so each run gets its own report folder to clean up
+        self.generation = generation
+        self.run = None  # open ReportRun, in memory only
+        self.lock = threading.Lock()
+        self.file_locks = {}
+
+    @property
+    def dir(self):
+        return os.path.join(SESSIONS_DIR, self.upload_id)
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.dir, "session.json")
+
+    def part_path(self, file_id):
+        return os.path.join(self.dir, f"{file_id}.part")
+
+    def report_dir(self):
+        safe_name = "".join([c if c.isalnum() or c in ('-', '_') else '_' for c in self.report_name])
+        return os.path.join(UPLOAD_DIR, f"{safe_name}_{self.upload_id[:8]}_{self.generation}")
+
+    def last_activity(self):
+        """Newest mtime in the session folder: every chunk and metadata save touches it."""
+        try:
+            return max(entry.stat().st_mtime for entry in os.scandir(self.dir))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def offset(self, file_id):
+        info = self.files[file_id]
+        if info["complete"]:
+            return info["size"]
+        path = self.part_path(file_id)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def save(self):
+        data = {
+            "upload_id": self.upload_id,
+            "user_id": self.user_id,
+            "report_id": self.report_id,
+            "report_name": self.report_name,
+            "files": self.files,
+            "generation": self.generation,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.meta_path)
+
+    @classmethod
+    def load(cls, upload_id):
+        with open(os.path.join(SESSIONS_DIR, upload_id, "session.json")) as f:
+            data = json.load(f)
+        return cls(**data)
+
+    def describe(self):
+        return {
+            "upload_id": self.upload_id,
+            "report_id": self.report_id,
+            "files": [
+                {"file_id": file_id, "filename": info["filename"], "size": info["size"],
+                 "offset": self.offset(file_id), "complete": info["complete"]}
+                for file_id, info in self.files.items()
+            ],
+        }
+
+
+class UploadSessionStore:
+    """Creates, resumes and finalizes upload sessions for the upload endpoints."""
+
+    def __init__(self, scheduler, idle_timeout=UPLOAD_SESSION_IDLE_TIMEOUT):
+        self.scheduler = scheduler
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="upload_session_sweeper", daemon=True)
+        self._sweeper.start()
+
+    def create(self, user_id, report_name):
+        report_id = create_report(report_name, user_id)
+        session = UploadSession(uuid.uuid4().hex, user_id, report_id, report_name)
+        os.makedirs(session.dir, exist_ok=True)
+        session.save()
+        with self._lock:
+            self._sessions[session.upload_id] = session
+        logger.info(f"User {user_id}: Resumable upload {session.upload_id} opened for report {report_id}")
+        return session
+
+    def get(self, upload_id, user_id):
+        """The user's session, reloaded from disk after a restart; None if unknown."""
+        if not upload_id.isalnum():
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                try:
+                    session = UploadSession.load(upload_id)
+                except FileNotFoundError:
+                    return None
+                self._sessions[upload_id] = session
+        return session if session.user_id == user_id else None
+
+    def add_file(self, session, filename, size):
+        filename = check_declared_upload(filename, size)
+        file_id = uuid.uuid4().hex
+        with session.lock:
+            session.files[file_id] = {"filename": filename, "size": size, "complete": False}
+            session.save()
+        return file_id
+
+    async def write_chunk(self, session, file_id, offset, chunks):
+        """
+        Append the byte stream `chunks` to the file at `offset`, which must be
+        the current offset. Returns the new offset; the file is handed to
+        processing when it reaches its declared size. A PUT at `offset ==
+        size` hands over a file whose bytes are all there but which is not
+        complete yet.
+        """
+        if file_id not in session.files:
+            raise KeyError(file_id)
+        lock = session.file_locks.setdefault(file_id, asyncio.Lock())
+        async with lock:
+            info = session.files[file_id]
+            current = session.offset(file_id)
+            if info["complete"] or offset != current:
+                raise OffsetMismatch(current)
+            # Admit the report before taking any bytes: a full scheduler
+            # (SchedulerFullError) then leaves the chunk safe to retry as is
+            await run_in_threadpool(self._open_run, session)
+            if current == info["size"]:
+                # Every byte arrived but the file was never handed over
+                # (e.g. a restart in between): complete it now
+                await run_in_threadpool(self._complete_file, session, file_id)
+                return current
+
+            written = current
+            async with aiofiles.open(session.part_path(file_id), "ab") as f:
+                async for chunk in chunks:
+                    if written + len(chunk) > info["size"]:
+                        raise UploadRejected(f"{info['filename']}: more bytes than the declared size")
+                    await f.write(chunk)
+                    written += len(chunk)
+
+            if written == info["size"]:
+                await run_in_threadpool(self._complete_file, session, file_id)
+            return written
+
+    def _complete_file(self, session, file_id):
+        info = session.files[file_id]
+        digest = hashlib.sha256()
+        with open(session.part_path(file_id), "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+
+        with session.lock:
+            run = self._ensure_run(session)
+            os.makedirs(run.report_dir, exist_ok=True)
+            path = os.path.join(run.report_dir, unique_name(info["filename"], set(os.listdir(run.report_dir))))
+            os.replace(session.part_path(file_id), path)
+            info["complete"] = True
+            session.save()
+        # Processing starts for this file while the others are still uploading
+        self.scheduler.add_image(run, path, digest.hexdigest())
+
+    def _open_run(self, session):
+        with session.lock:
+            self._ensure_run(session)
+
+    def _ensure_run(self, session):
+        """Open a scheduler run for the session (again, after a restart). Caller holds session.lock."""
+        if session.run is None:
+            session.generation += 1
+            session.run = self.scheduler.open_report(session.report_dir(), session.report_id, session.user_id)
+        return session.run
+
+    def finalize(self, session):
+        """
+        Seal the report once every file is complete. Returns the session
+        description; raises UploadRejected if files are missing or incomplete.
+        """
+        with session.lock:
+            incomplete = [info["filename"] for info in session.files.values() if not info["complete"]]
+            if incomplete:
+                raise UploadRejected(f"Incomplete files: {', '.join(incomplete)}")
+            if not session.files:
+                raise UploadRejected("At least one file is required")
+            description = session.describe()
+            run, session.run = session.run, None
+
+        if run is not None:
+            self.scheduler.seal_report(run)
+        shutil.rmtree(session.dir, ignore_errors=True)
+        with self._lock:
+            self._sessions.pop(session.upload_id, None)
+        logger.info(f"User {session.user_id}: Resumable upload {session.upload_id} finalized "
+                    f"with {len(session.files)} files")
+        return description
+
+
+    def expire_idle(self):
+        """
+        Close every session (in memory or only on disk) idle for longer than
+        `idle_timeout`: seal its report with the files that completed, or
+        delete the report if none did, and remove the session folder.
+        """
+        if not os.path.isdir(SESSIONS_DIR):
+            return
+        deadline = time.time() - self.idle_timeout
+        for upload_id in os.listdir(SESSIONS_DIR):
+            with self._lock:
+                session = self._sessions.get(upload_id)
+            if session is None:
+                try:
+                    session = UploadSession.load(upload_id)
+                except (FileNotFoundError, ValueError, TypeError):
+                    # Never got a readable session.json
+                    path = os.path.join(SESSIONS_DIR, upload_id)
+                    if os.path.getmtime(path) < deadline:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+            if session.last_activity() >= deadline:
+                continue
+            try:
+                self._expire(session)
+            except Exception as e:
+                logger.error(f"Could not expire resumable upload {upload_id}: {str(e)}")
+
+    def _expire(self, session):
+        with session.lock:
+            run, session.run = session.run, None
+            completed = sum(1 for info in session.files.values() if info["complete"])
+        with self._lock:
+            self._sessions.pop(session.upload_id, None)
+        if run is not None:
+            self.scheduler.seal_report(run)
+        shutil.rmtree(session.dir, ignore_errors=True)
+        if not completed:
+            delete_report(session.report_id)
+        logger.warning(f"User {session.user_id}: Resumable upload {session.upload_id} expired after "
+                       f"{self.idle_timeout}s idle ({completed}/{len(session.files)} files complete)")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(UPLOAD_SWEEP_INTERVAL)
+            self.expire_idle()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_sessions(scheduler):
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadSessionStore(scheduler)
+        return _store
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Request, Form, UploadFile, File, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 import os
+import uuid
+import asyncio
+from urllib.parse import quote
 from datetime import datetime
 from sqlalchemy import func
 from sqlalchemy.orm import Session
@@ -9,8 +13,9 @@ from sqlalchemy.orm import Session
 from backend.database import SessionLocal
 from backend.models.report import Report
 from backend.models.inference import Inference
-from backend.services.data_manager import create_report
-from backend.services.inferences import get_inferences
+from backend.services.progress import progress_bus, format_sse
+from app.upload_stream import stream_multipart, StreamingReportUpload, UploadRejected
+from app.config import DIRECT_S3_UPLOAD
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -58,7 +63,8 @@ def reports_page(request: Request, search: str = None):
         return templates.TemplateResponse("reports.html", {
             "request": request,
             "reports": reports,
-            "search_query": search
+            "search_query": search,
+            "direct_upload": DIRECT_S3_UPLOAD
         })
     except Exception as e:
         return templates.TemplateResponse(
@@ -71,49 +77,38 @@ def reports_page(request: Request, search: str = None):
 
 
 @router.post("/reports/create")
-async def create_report_endpoint(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    report_name: str = Form(...),
-    files: list[UploadFile] = File(...)
-):
-    """Create a new report with file uploads"""
+async def create_report_endpoint(request: Request):
+    """Create a new report with file uploads, streamed to disk as they arrive"""
     # Check if user is logged in
     user_id = request.session.get("user_id")
     if not user_id:
         return RedirectResponse("/login", status_code=303)
     
-    try:
-        if not report_name or not report_name.strip():
-            return RedirectResponse(url="/reports?error=Report name is required", status_code=303)
-        
-        if not files or len(files) == 0:
-            return RedirectResponse(url="/reports?error=At least one file is required", status_code=303)
+    staging_dir = os.path.join(UPLOAD_DIR, f".incoming_{uuid.uuid4().hex}")
 
+    def report_dir_for(report_name):
         # Sanitize folder name
         safe_name = "".join([
             c if c.isalnum() or c in (' ', '-', '_') else '_' 
             for c in report_name
         ]).strip()
-        
-        report_dir = os.path.join(UPLOAD_DIR, safe_name)
-        os.makedirs(report_dir, exist_ok=True)
-
-        # Save uploaded files
-        for file in files:
-            if file.filename:
-                file_path = os.path.join(report_dir, file.filename)
-                with open(file_path, "wb") as f:
-                    f.write(await file.read())
-
-        # Create report in database WITH USER_ID
-        report_id = create_report(report_name, user_id)
+        return os.path.join(UPLOAD_DIR, safe_name)
 
-        # Queue background image processing task
-        background_tasks.add_task(get_inferences, report_dir, report_id, user_id)
-
-        return RedirectResponse(url="/reports?success=Report created successfully", status_code=303)
+    # The report is created and admitted to the global scheduler (shared with
+    # /upload) as soon as its name arrives; each image is processed as soon as
+    # it has been written, while the rest of the upload is still streaming in
+    upload = StreamingReportUpload(request.app.state.scheduler, user_id, staging_dir, report_dir_for)
+    try:
+        await stream_multipart(request, upload.dest_dir, on_field=upload.on_field, on_file=upload.on_file,
+                               on_skip=upload.on_skip)
+        await upload.finish()
+        message = "Report created successfully." + upload.skipped_note()
+        return RedirectResponse(url="/reports?success=" + quote(message), status_code=303)
+    except UploadRejected as e:
+        await upload.abort()
+        return RedirectResponse(url=f"/reports?error={str(e)}", status_code=303)
     except Exception as e:
+        await upload.abort()
         return RedirectResponse(url=f"/reports?error=Error creating report: {str(e)}", status_code=303)
 
 
@@ -169,3 +164,53 @@ def get_report_api(report_id: int):
         return {"error": str(e), "status": 500}
     finally:
         close_db(db)
+
+
+def _user_owns_report(report_id: int, user_id: int) -> bool:
+    db = get_db()
+    try:
+        return db.query(Report.id).filter(Report.id == report_id, Report.user_id == user_id).first() is not None
+    finally:
+        close_db(db)
+
+
+@router.get("/api/report/{report_id}/events")
+async def report_events(request: Request, report_id: int):
+    """
+    Server-sent events for a report being processed:
+    - `progress`: snapshot on connect ({"status": "idle"} if not processing)
+    - `image`: one per finished image, with its newly written inference rows
+    - `done`: final counts; the stream ends after it
+    """
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not await run_in_threadpool(_user_owns_report, report_id, user_id):
+        return JSONResponse({"error": "Report not found"}, status_code=404)
+
+    # Subscribe before taking the snapshot so no event falls in between
+    queue = progress_bus.subscribe(report_id, asyncio.get_running_loop())
+    snapshot = request.app.state.scheduler.report_progress(report_id)
+
+    async def stream():
+        try:
+            yield format_sse("progress", snapshot or {"report_id": report_id, "status": "idle"})
+            if snapshot is None:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+                if event == "done":
+                    return
+        finally:
+            progress_bus.unsubscribe(report_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Request, Form, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 import os
 import uuid
 import logging
-from backend.services.data_manager import create_report
-from backend.services.inferences import get_inferences
+from urllib.parse import quote
+from backend.services.pipeline import get_pipeline, ocr_client
+from app.upload_stream import stream_multipart, StreamingReportUpload, UploadRejected
+from app.resumable_upload import get_upload_sessions, OffsetMismatch
+from app.direct_upload import get_direct_uploads
+from backend.services.scheduler import SchedulerFullError
+from app.config import UPLOAD_DIR, DIRECT_S3_UPLOAD
 
 logger = logging.getLogger(__name__)
 
@@ -22,51 +28,233 @@ def upload_get(request: Request):
     return RedirectResponse("/reports", status_code=303)
 
 @router.post("/upload", response_class=HTMLResponse)
-async def upload_post(request: Request, report_name: str = Form(...), files: list[UploadFile] = File(...)):
+async def upload_post(request: Request):
     """
     Handle upload form submission from reports page.
     
     Design:
-    - Images from the same user are processed sequentially (maintains order)
-    - Different users' uploads are processed in parallel (up to 4 concurrent)
-    - Uses global ThreadPoolExecutor to manage concurrent user tasks
+    - The multipart body is streamed to disk as it arrives (constant memory),
+      with size/type limits and hashing applied chunk by chunk
+    - The report is admitted to the global scheduler (shared with /reports/create)
+      before the upload ends, and each image is processed as soon as it lands
+    - Images from all users share one concurrency budget; users take turns
     """
     if not request.session.get("user"):
         return RedirectResponse("/login")
     
     user_id = request.session.get("user_id")
-    
-    try:
-        # create DB report entry with user_id
-        report_id = create_report(report_name, user_id=user_id)
+    staging_dir = os.path.join(UPLOAD_DIR, f".incoming_{uuid.uuid4().hex}")
 
-        # create folder for this report
+    def report_dir_for(report_name):
         safe_name = "".join([c if c.isalnum() or c in (' ', '-', '_') else '_' for c in report_name]).strip().replace(' ', '_')
-        report_dir = os.path.join("uploaded_reports", f"{safe_name}_{uuid.uuid4().hex[:8]}")
-        os.makedirs(report_dir, exist_ok=True)
-
-        # save files
-        for f in files:
-            file_path = os.path.join(report_dir, f.filename)
-            with open(file_path, "wb") as fh:
-                fh.write(await f.read())
-
-        # Submit processing task to global executor
-        # This allows multiple users' uploads to process in parallel
-        # but within each user's task, images process sequentially
-        executor = request.app.state.upload_executor
-        future = executor.submit(get_inferences, report_dir, report_id, user_id)
-        
+        return os.path.join(UPLOAD_DIR, f"{safe_name}_{uuid.uuid4().hex[:8]}")
+
+    # The report is created and admitted as soon as its name arrives; each
+    # image joins the pipeline the moment it is fully written
+    upload = StreamingReportUpload(request.app.state.scheduler, user_id, staging_dir, report_dir_for)
+    try:
+        await stream_multipart(request, upload.dest_dir, on_field=upload.on_field, on_file=upload.on_file,
+                               on_skip=upload.on_skip)
+        report_id = await upload.finish()
         logger.info(f"User {user_id}: Report {report_id} submitted for processing")
 
-        return RedirectResponse(
-            url="/reports?success=Report created successfully! Processing has started in background.",
-            status_code=303
-        )
+        message = "Report created successfully! Processing has started in background." + upload.skipped_note()
+        return RedirectResponse(url="/reports?success=" + quote(message), status_code=303)
+    except UploadRejected as e:
+        await upload.abort()
+        logger.warning(f"Upload rejected for user {user_id}: {str(e)}")
+        return RedirectResponse(url=f"/reports?error={str(e)}", status_code=303)
     except Exception as e:
+        await upload.abort()
         logger.error(f"Upload error for user {user_id}: {str(e)}")
         return RedirectResponse(
             url="/reports?error=Failed to create report: " + str(e),
             status_code=303
         )
 
+
+@router.get("/api/pipeline/stats")
+def pipeline_stats(request: Request):
+    """Queue depth and latency per pipeline stage, plus OCR payload counters"""
+    if not request.session.get("user"):
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    pipeline = get_pipeline()
+    return {
+        "scheduler": request.app.state.scheduler.stats(),
+        "stages": pipeline.stats(),
+        "counters": pipeline.counter_stats(),
+        "ocr": ocr_client.get_stats(),
+    }
+
+
+# ==================== RESUMABLE UPLOADS ====================
+# POST /api/uploads                                  {"report_name"} -> {"upload_id", "report_id"}
+# POST /api/uploads/{upload_id}/files                {"filename", "size"} -> {"file_id"}
+# PUT  /api/uploads/{upload_id}/files/{file_id}?offset=N   raw chunk bytes -> {"offset"}
+#      (an empty PUT at offset=size completes a file whose bytes are all stored)
+# GET  /api/uploads/{upload_id}/files/{file_id}      -> {"offset", "size", "complete"}
+# GET  /api/uploads/{upload_id}                      -> session with every file's offset
+# POST /api/uploads/{upload_id}/finalize             -> seals the report
+
+def _upload_session(request: Request, upload_id: str):
+    """(session, error_response) for the logged-in user's upload session"""
+    if not request.session.get("user"):
+        return None, JSONResponse({"error": "Not authenticated"}, status_code=401)
+    sessions = get_upload_sessions(request.app.state.scheduler)
+    session = sessions.get(upload_id, request.session.get("user_id"))
+    if session is None:
+        return None, JSONResponse({"error": "Upload not found"}, status_code=404)
+    return session, None
+
+
+@router.post("/api/uploads")
+async def create_upload_session(request: Request):
+    """Open a resumable upload for a new report"""
+    if not request.session.get("user"):
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    body = await request.json()
+    report_name = str(body.get("report_name", "")).strip()
+    if not report_name:
+        return JSONResponse({"error": "Report name is required"}, status_code=400)
+    sessions = get_upload_sessions(request.app.state.scheduler)
+    session = await run_in_threadpool(sessions.create, request.session.get("user_id"), report_name)
+    return {"upload_id": session.upload_id, "report_id": session.report_id}
+
+
+@router.get("/api/uploads/{upload_id}")
+def get_upload_session(request: Request, upload_id: str):
+    session, error = _upload_session(request, upload_id)
+    if error:
+        return error
+    return session.describe()
+
+
+@router.post("/api/uploads/{upload_id}/files")
+async def add_upload_file(request: Request, upload_id: str):
+    """Register a file (name and total size) before sending its chunks"""
+    session, error = _upload_session(request, upload_id)
+    if error:
+        return error
+    body = await request.json()
+    sessions = get_upload_sessions(request.app.state.scheduler)
+    try:
+        file_id = await run_in_threadpool(sessions.add_file, session, body.get("filename", ""), body.get("size"))
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {"file_id": file_id}
+
+
+@router.get("/api/uploads/{upload_id}/files/{file_id}")
+def get_upload_file_offset(request: Request, upload_id: str, file_id: str):
+    """Where to resume: the number of bytes already stored for this file"""
+    session, error = _upload_session(request, upload_id)
+    if error:
+        return error
+    if file_id not in session.files:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    info = session.files[file_id]
+    return {"offset": session.offset(file_id), "size": info["size"], "complete": info["complete"]}
+
+
+@router.put("/api/uploads/{upload_id}/files/{file_id}")
+async def put_upload_chunk(request: Request, upload_id: str, file_id: str, offset: int):
+    """Append one chunk at `offset`; 409 with the real offset if it does not match"""
+    session, error = _upload_session(request, upload_id)
+    if error:
+        return error
+    sessions = get_upload_sessions(request.app.state.scheduler)
+    try:
+        new_offset = await sessions.write_chunk(session, file_id, offset, request.stream())
+    except KeyError:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    except OffsetMismatch as e:
+        return JSONResponse({"error": str(e), "offset": e.offset}, status_code=409)
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except SchedulerFullError:
+        return JSONResponse(
+            {"error": StreamingReportUpload.BUSY_MESSAGE},
+            status_code=503
+        )
+    return {"offset": new_offset, "complete": session.files[file_id]["complete"]}
+
+
+@router.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload_session(request: Request, upload_id: str):
+    """Seal the report once every registered file has been fully uploaded"""
+    session, error = _upload_session(request, upload_id)
+    if error:
+        return error
+    sessions = get_upload_sessions(request.app.state.scheduler)
+    try:
+        return await run_in_threadpool(sessions.finalize, session)
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+
+
+# ==================== DIRECT-TO-S3 UPLOADS ====================
+# POST /api/direct-uploads        {"report_name", "files": [{"filename", "size", "content_type"}]}
+#                                  -> {"upload_id", "report_id", "part_size", "files": [{"file_id", "parts": [{"part_number", "url"}]}]}
+# POST /api/direct-uploads/{upload_id}/files/{file_id}/complete   {"parts": [{"part_number", "etag"}]}
+# POST /api/direct-uploads/{upload_id}/finalize
+
+def _direct_upload(request: Request, upload_id: str):
+    """(session, error_response) for the logged-in user's direct upload"""
+    if not request.session.get("user"):
+        return None, JSONResponse({"error": "Not authenticated"}, status_code=401)
+    session = get_direct_uploads(request.app.state.scheduler).get(upload_id, request.session.get("user_id"))
+    if session is None:
+        return None, JSONResponse({"error": "Upload not found"}, status_code=404)
+    return session, None
+
+
+@router.post("/api/direct-uploads")
+async def create_direct_upload(request: Request):
+    """Create a report and presigned S3 multipart URLs for the browser to upload to"""
+    if not request.session.get("user"):
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if not DIRECT_S3_UPLOAD:
+        return JSONResponse({"error": "Direct S3 uploads are disabled"}, status_code=404)
+    body = await request.json()
+    report_name = str(body.get("report_name", "")).strip()
+    if not report_name:
+        return JSONResponse({"error": "Report name is required"}, status_code=400)
+    uploads = get_direct_uploads(request.app.state.scheduler)
+    try:
+        return await run_in_threadpool(uploads.create, request.session.get("user_id"), report_name, body.get("files") or [])
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except SchedulerFullError:
+        return JSONResponse({"error": StreamingReportUpload.BUSY_MESSAGE}, status_code=503)
+
+
+@router.post("/api/direct-uploads/{upload_id}/files/{file_id}/complete")
+async def complete_direct_upload_file(request: Request, upload_id: str, file_id: str):
+    """The browser finished a file's parts: complete it in S3 and start processing it"""
+    session, error = _direct_upload(request, upload_id)
+    if error:
+        return error
+    body = await request.json()
+    parts = [(int(p["part_number"]), p["etag"]) for p in body.get("parts", [])]
+    uploads = get_direct_uploads(request.app.state.scheduler)
+    try:
+        await run_in_threadpool(uploads.complete_file, session, file_id, parts)
+    except KeyError:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    except Exception as e:
+        logger.error(f"Direct upload {upload_id}: could not complete file {file_id}: {str(e)}")
+        return JSONResponse({"error": f"Could not complete upload: {str(e)}"}, status_code=502)
+    return {"file_id": file_id, "complete": True}
+
+
+@router.post("/api/direct-uploads/{upload_id}/finalize")
+async def finalize_direct_upload(request: Request, upload_id: str):
+    """All files sent (or given up on): seal the report"""
+    session, error = _direct_upload(request, upload_id)
+    if error:
+        return error
+    uploads = get_direct_uploads(request.app.state.scheduler)
+    try:
+        return await run_in_threadpool(uploads.finalize, upload_id, session)
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
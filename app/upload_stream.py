@@ -0,0 +1,356 @@
+"""
+Streaming ingestion of multipart uploads.
+
+Request bodies are parsed chunk by chunk straight from the socket instead of
+being spooled by Starlette first: every file part is written to disk in
+chunks as it arrives, hashed in the same pass, and checked against
+MAX_UPLOAD_SIZE / ALLOWED_IMAGE_EXTENSIONS before a byte too many is kept.
+Memory stays constant whatever the size or number of files.
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+from collections import namedtuple
+
+import aiofiles
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import MAX_UPLOAD_SIZE, ALLOWED_IMAGE_EXTENSIONS, ERROR_MESSAGES
+from backend.services.data_manager import create_report, delete_report
+from backend.services.scheduler import SchedulerFullError
+
+logger = logging.getLogger(__name__)
+
+MAX_FIELD_SIZE = 64 * 1024  # plain form fields (report name, ...)
+
+# One fully written upload: where it landed, its size and sha256
+IngestedFile = namedtuple("IngestedFile", ["field_name", "filename", "path", "size", "content_hash"])
+
+
+class UploadRejected(Exception):
+    """Raised while streaming when an upload breaks a limit; the message is user-facing"""
+
+
+def clean_upload_name(filename):
+    """
+    Base name of an uploaded file (client paths are never trusted), after
+    checking its type. Raises UploadRejected with a user-facing message.
+    """
+    filename = os.path.basename(str(filename).replace("\\", "/"))
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
+        raise UploadRejected(f"{filename}: {ERROR_MESSAGES['invalid_file_type']}")
+    return filename
+
+
+def check_declared_upload(filename, size):
+    """clean_upload_name() plus a check of the total `size` a client declares up front."""
+    filename = clean_upload_name(filename)
+    if not isinstance(size, int) or size <= 0:
+        raise UploadRejected(f"{filename}: size must be a positive number of bytes")
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadRejected(f"{filename}: {ERROR_MESSAGES['file_too_large']}")
+    return filename
+
+
+def unique_name(filename, taken):
+    """
+    `filename`, or `<stem>_1<ext>`, `<stem>_2<ext>`, ... if it is already in
+    `taken`. Uploads often repeat names (DJI_0001.JPG from several SD cards)
+    and a queued file must never be replaced by a later one.
+    """
+    stem, ext = os.path.splitext(filename)
+    name, n = filename, 1
+    while name in taken:
+        name = f"{stem}_{n}{ext}"
+        n += 1
+    return name
+
+
+class FileSink:
+    """
+    Writes one uploaded file to `dest_dir` in chunks, hashing and enforcing
+    the size limit as bytes arrive. Data goes to a hidden .part file that is
+    renamed into place by `finish()`, so a file only ever appears complete;
+    a name already taken in `dest_dir` gets a numeric suffix.
+    """
+
+    def __init__(self, dest_dir, filename, field_name="files", max_size=MAX_UPLOAD_SIZE):
+        self.filename = clean_upload_name(filename)
+        self.field_name = field_name
+        self.max_size = max_size
+        self.dest_dir = dest_dir
+        self.path = None
+        self.part_path = os.path.join(dest_dir, f".{self.filename}.part")
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+
+    async def open(self):
+        self._file = await aiofiles.open(self.part_path, "wb")
+        return self
+
+    async def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadRejected(f"{self.filename}: {ERROR_MESSAGES['file_too_large']}")
+        self._hash.update(chunk)
+        await self._file.write(chunk)
+
+    def on_skip(self, filename, reason):
+        logger.warning(f"User {self.user_id}: Skipped upload {filename}: {reason}")
+        self.skipped.append((filename, reason))
+
+    def skipped_note(self):
+        """User-facing summary of skipped files, or an empty string."""
+        if not self.skipped:
+            return ""
+        return f" Skipped {len(self.skipped)} file(s): " + "; ".join(reason for _, reason in self.skipped)
+
+    async def finish(self):
+        await self._file.close()
+        self.path = os.path.join(self.dest_dir, unique_name(self.filename, set(os.listdir(self.dest_dir))))
+        os.replace(self.part_path, self.path)
+        return IngestedFile(self.field_name, self.filename, self.path, self.size, self._hash.hexdigest())
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+async def stream_multipart(request: Request, dest_dir, on_field=None, on_file=None, on_skip=None):
+    """
+    Parse a multipart/form-data body as it streams in, writing file parts
+    into `dest_dir` (a path, or a callable returning the current target
+    folder for the next file). `on_field(name, value)` and `on_file(IngestedFile)`
+    (either may be async) are called as soon as each part is complete,
+    in body order. A file of the wrong type or over the size limit is
+    skipped (its partial data removed) and reported to `on_skip(filename,
+    reason)`; the rest of the upload carries on. Returns (fields, files).
+    Raises UploadRejected on a bad request; partial files are removed.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected("Expected a multipart/form-data upload")
+
+    def target_dir():
+        path = dest_dir() if callable(dest_dir) else dest_dir
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # Parser callbacks only record events; they are handled (with awaits)
+    # after each chunk is fed in
+    events = []
+
+    def record(kind):
+        def on_event(data=None, start=None, end=None):
+            events.append((kind, bytes(data[start:end]) if data is not None else None))
+        return on_event
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": record("part_begin"),
+        "on_part_data": record("part_data"),
+        "on_part_end": record("part_end"),
+        "on_header_field": record("header_field"),
+        "on_header_value": record("header_value"),
+        "on_header_end": record("header_end"),
+        "on_headers_finished": record("headers_finished"),
+    })
+
+    fields, files = {}, []
+    headers, header_field, header_value = {}, b"", b""
+    part_name, sink, value, skip = None, None, bytearray(), False
+
+    async def call(callback, *args):
+        result = callback(*args)
+        if hasattr(result, "__await__"):
+            await result
+
+    async def handle(kind, data):
+        nonlocal headers, header_field, header_value, part_name, sink, value, skip
+        if kind == "part_begin":
+            headers, header_field, header_value = {}, b"", b""
+            part_name, sink, value, skip = None, None, bytearray(), False
+        elif kind == "header_field":
+            header_field += data
+        elif kind == "header_value":
+            header_value += data
+        elif kind == "header_end":
+            headers[header_field.lower()] = header_value
+            header_field, header_value = b"", b""
+        elif kind == "headers_finished":
+            if b"content-disposition" in headers:
+                _, options = parse_options_header(headers[b"content-disposition"])
+                part_name = options.get(b"name", b"").decode()
+                if b"filename" in options:
+                    filename = options[b"filename"].decode()
+                    if filename:
+                        try:
+                            sink = await FileSink(target_dir(), filename, part_name).open()
+                        except UploadRejected as e:
+                            skip = True
+                            if on_skip:
+                                await call(on_skip, filename, str(e))
+                    else:
+                        skip = True  # empty file input
+        elif kind == "part_data":
+            if sink is not None:
+                try:
+                    await sink.write(data)
+                except UploadRejected as e:
+                    # Over the size limit: drop this file, keep the others
+                    await sink.abort()
+                    filename, sink, skip = sink.filename, None, True
+                    if on_skip:
+                        await call(on_skip, filename, str(e))
+            elif not skip:
+                value += data
+                if len(value) > MAX_FIELD_SIZE:
+                    raise UploadRejected(f"Form field {part_name} is too large")
+        elif kind == "part_end":
+            if sink is not None:
+                info = await sink.finish()
+                sink = None
+                files.append(info)
+                if on_file:
+                    await call(on_file, info)
+            elif not skip and part_name:
+                fields[part_name] = value.decode()
+                if on_field:
+                    await call(on_field, part_name, fields[part_name])
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                await handle(kind, data)
+            events.clear()
+        parser.finalize()
+        for kind, data in events:
+            await handle(kind, data)
+    except Exception:
+        if sink is not None:
+            await sink.abort()
+        raise
+    return fields, files
+
+
+def move_into_place(staging_dir, report_dir):
+    """
+    Move streamed files from `staging_dir` into `report_dir` by rename (same
+    filesystem, no copy). Returns {old_path: new_path}.
+    """
+    moved = {}
+    if not os.path.exists(report_dir):
+        os.makedirs(os.path.dirname(report_dir) or ".", exist_ok=True)
+        os.rename(staging_dir, report_dir)
+        for name in os.listdir(report_dir):
+            moved[os.path.join(staging_dir, name)] = os.path.join(report_dir, name)
+        return moved
+    taken = set(os.listdir(report_dir))
+    for name in os.listdir(staging_dir):
+        target = unique_name(name, taken)
+        taken.add(target)
+        moved[os.path.join(staging_dir, name)] = os.path.join(report_dir, target)
+        os.replace(os.path.join(staging_dir, name), os.path.join(report_dir, target))
+    os.rmdir(staging_dir)
+    return moved
+
+
+class StreamingReportUpload:
+    """
+    Starts processing a report while its upload is still arriving.
+
+    The report is created and opened in the scheduler as soon as the
+    `report_name` field has been read (forms send it before the files), and
+    each file is handed to the pipeline the moment it is fully written.
+    Files that arrive before the name wait in `staging_dir`; files that
+    were skipped are listed in `skipped` for `skipped_note()`.
+    Use `dest_dir`, `on_field`, `on_file` and `on_skip` as stream_multipart()
+    hooks, then call `finish()`, or `abort()` if the upload failed.
+    """
+
+    BUSY_MESSAGE = "The server is busy processing other reports. Please try again shortly."
+
+    def __init__(self, scheduler, user_id, staging_dir, report_dir_for):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.staging_dir = staging_dir
+        self.report_dir_for = report_dir_for  # report_name -> report folder
+        self.report_id = None
+        self.report_dir = None
+        self.run = None
+        self.files = []
+        self.skipped = []  # (filename, reason)
+
+    def dest_dir(self):
+        return self.report_dir or self.staging_dir
+
+    async def on_field(self, name, value):
+        if name == "report_name" and value.strip() and self.run is None:
+            await run_in_threadpool(self._open, value)
+
+    def _open(self, report_name):
+        self.report_id = create_report(report_name, self.user_id)
+        report_dir = self.report_dir_for(report_name)
+        try:
+            self.run = self.scheduler.open_report(report_dir, self.report_id, self.user_id)
+        except SchedulerFullError:
+            delete_report(self.report_id)
+            raise UploadRejected(self.BUSY_MESSAGE)
+
+        # Files streamed before the name arrived move into the report folder
+        moved = move_into_place(self.staging_dir, report_dir) if os.path.isdir(self.staging_dir) else {}
+        self.report_dir = report_dir
+        self.files = [f._replace(path=moved.get(f.path, f.path)) for f in self.files]
+        for f in self.files:
+            self.scheduler.add_image(self.run, f.path, f.content_hash)
+
+    async def on_file(self, info):
+        self.files.append(info)
+        if self.run is not None:
+            await run_in_threadpool(self.scheduler.add_image, self.run, info.path, info.content_hash)
+
+    def on_skip(self, filename, reason):
+        logger.warning(f"User {self.user_id}: Skipped upload {filename}: {reason}")
+        self.skipped.append((filename, reason))
+
+    def skipped_note(self):
+        """User-facing summary of skipped files, or an empty string."""
+        if not self.skipped:
+            return ""
+        return f" Skipped {len(self.skipped)} file(s): " + "; ".join(reason for _, reason in self.skipped)
+
+    async def finish(self):
+        """The whole body arrived: seal the report. Returns its report_id."""
+        if self.run is None:
+            raise UploadRejected("Report name is required")
+        run, self.run = self.run, None
+        await run_in_threadpool(self.scheduler.seal_report, run)
+        if not self.files:
+            await run_in_threadpool(delete_report, self.report_id)
+            raise UploadRejected("At least one image file is required." + self.skipped_note())
+        logger.info(f"User {self.user_id}: Report {self.report_id} fully uploaded ({len(self.files)} files)")
+        return self.report_id
+
+    async def abort(self):
+        """
+        The upload failed part-way. Images already received keep processing
+        (the report is sealed with them); with no report yet, the staged
+        files are discarded.
+        """
+        if self.run is not None:
+            run, self.run = self.run, None
+            await run_in_threadpool(self.scheduler.seal_report, run)
+        if os.path.isdir(self.staging_dir):
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
@@ -19,6 +19,7 @@ from .db_queries import (
     batch_delete_inferences,
     get_inference_with_details,
 )
+from .ttl_cache import TTLCache
 
 __all__ = [
     "get_user_reports",
@@ -35,4 +36,5 @@ __all__ = [
     "create_or_update_user_settings",
     "batch_delete_inferences",
     "get_inference_with_details",
+    "TTLCache",
 ]
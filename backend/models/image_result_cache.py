@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+from backend.database import Base
+
+class ImageResultCache(Base):
+    __tablename__ = "image_result_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha256 of image content + model version + thresholds
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)
+
+    # JSON list of [unique_id, [x, y]] from OCR, with the VIN appended when read from a sticker QR
+    unique_ids = Column(Text, nullable=True)
+    detection_found = Column(Boolean, nullable=False)
+    s3_key = Column(String(255), nullable=True)
+    s3_obj_url = Column(String(255), nullable=True)
+
+    hits = Column(Integer, default=0)
+    createdAt = Column(DateTime, nullable=True)
+    lastUsedAt = Column(DateTime, nullable=True, index=True)
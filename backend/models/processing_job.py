@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from backend.database import Base
+
+# Job / image statuses
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=True)
+    report_dir = Column(String(512), nullable=False)
+    status = Column(String(16), nullable=False, default=STATUS_RUNNING, index=True)
+
+    createdAt = Column(DateTime, nullable=True)
+    updatedAt = Column(DateTime, nullable=True)
+
+class ProcessingImage(Base):
+    __tablename__ = "processing_images"
+    __table_args__ = (Index("ix_processing_images_job_status", "job_id", "status"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)  # 1-based order within the report
+    image_path = Column(String(512), nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    status = Column(String(16), nullable=False, default=STATUS_PENDING)
+
+    updatedAt = Column(DateTime, nullable=True)
@@ -1,20 +1,52 @@
-from datetime import date
+from datetime import date, datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert, update
 from urllib3 import request
 from backend.database import SessionLocal
 from backend.models.report import Report
 from backend.models.inference import Inference
 from backend.models.raw_data import RawData
+from backend.models.processing_job import (
+    ProcessingJob, ProcessingImage, STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+)
+from backend.helpers.ttl_cache import TTLCache
+from app.config import RECORD_CACHE_SIZE, RECORD_CACHE_TTL
+
+# unique_id -> RawData (or None when the ID has no row, so misses are cached too)
+_record_cache = TTLCache(maxsize=RECORD_CACHE_SIZE, ttl=RECORD_CACHE_TTL)
+_NOT_CACHED = object()
 
 def get_reports():
     with SessionLocal() as session:
         return session.query(Report).all()
 
+def get_records(unique_ids):
+    """
+    Resolve many unique IDs at once: cached IDs are served from memory and
+    the rest are fetched with a single `IN (...)` query.
+    Returns {unique_id: RawData or None}.
+    """
+    records = {}
+    missing = []
+    for unique_id in dict.fromkeys(unique_ids):
+        cached = _record_cache.get(unique_id, _NOT_CACHED)
+        if cached is _NOT_CACHED:
+            missing.append(unique_id)
+        else:
+            records[unique_id] = cached
+
+    if missing:
+        with SessionLocal() as session:
+            stmt = select(RawData).where(RawData.unique_id.in_(missing))
+            fetched = {row.unique_id: row for row in session.execute(stmt).scalars()}
+        for unique_id in missing:
+            record = fetched.get(unique_id)
+            _record_cache.set(unique_id, record)
+            records[unique_id] = record
+    return records
+
 def get_record(unique_id: str):
-    with SessionLocal() as session:
-        stmt = select(RawData).where(RawData.unique_id == unique_id)
-        return session.execute(stmt).scalars().first()
+    return get_records([unique_id])[unique_id]
 def get_reports_today():
     with SessionLocal() as session:
         # Report.createdAt is a Date column, compare directly without func.date()
@@ -63,6 +95,96 @@ def upload_result(inference_obj: Inference):
         logger.info(f"✅ Inference saved - ID: {inference_obj.id}, Report: {inference_obj.report_id}, User: {inference_obj.user_id}, CreatedAt: {inference_obj.createdAt}")
         return inference_obj
 
+def insert_inferences(rows, done_image_ids=()):
+    """
+    Insert many inference rows (dicts of Inference columns) in one
+    transaction using a multi-row INSERT, without a per-row refresh.
+    `done_image_ids` (processing_images ids) are checkpointed as done in the
+    same transaction, so a restart never re-processes an image whose rows
+    are already stored.
+    """
+    if not rows:
+        return 0
+    with SessionLocal() as session:
+        session.execute(insert(Inference), rows)
+        if done_image_ids:
+            session.execute(
+                update(ProcessingImage)
+                .where(ProcessingImage.id.in_(list(done_image_ids)))
+                .values(status=STATUS_DONE, updatedAt=datetime.now())
+            )
+        session.commit()
+    return len(rows)
+
+# ==================== PROCESSING JOBS ====================
+
+def create_processing_job(report_id: int, user_id: int, report_dir: str, image_paths, content_hashes=None):
+    """
+    Persist a report's processing job and one pending row per image.
+    Returns (job_id, [(image_id, position, image_path, content_hash), ...]).
+    """
+    content_hashes = content_hashes or {}
+    now = datetime.now()
+    with SessionLocal() as session:
+        job = ProcessingJob(report_id=report_id, user_id=user_id, report_dir=report_dir,
+                            status=STATUS_RUNNING, createdAt=now, updatedAt=now)
+        session.add(job)
+        session.flush()
+        images = [
+            ProcessingImage(job_id=job.id, position=position, image_path=path,
+                            content_hash=content_hashes.get(path), status=STATUS_PENDING, updatedAt=now)
+            for position, path in enumerate(image_paths, 1)
+        ]
+        session.add_all(images)
+        session.commit()
+        return job.id, [(img.id, img.position, img.image_path, img.content_hash) for img in images]
+
+def add_processing_image(job_id: int, position: int, image_path: str, content_hash=None):
+    """Add one pending image to an existing job (uploads still streaming in). Returns its id."""
+    with SessionLocal() as session:
+        image = ProcessingImage(job_id=job_id, position=position, image_path=image_path,
+                                content_hash=content_hash, status=STATUS_PENDING, updatedAt=datetime.now())
+        session.add(image)
+        session.commit()
+        return image.id
+
+def mark_images_failed(image_ids):
+    if not image_ids:
+        return
+    with SessionLocal() as session:
+        session.execute(
+            update(ProcessingImage)
+            .where(ProcessingImage.id.in_(list(image_ids)))
+            .values(status=STATUS_FAILED, updatedAt=datetime.now())
+        )
+        session.commit()
+
+def finish_processing_job(job_id: int):
+    with SessionLocal() as session:
+        session.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id)
+            .values(status=STATUS_DONE, updatedAt=datetime.now())
+        )
+        session.commit()
+
+def get_unfinished_jobs():
+    """
+    Jobs still marked running, each with its image rows.
+    Returns [(ProcessingJob, [ProcessingImage, ...]), ...].
+    """
+    with SessionLocal() as session:
+        jobs = session.execute(
+            select(ProcessingJob).where(ProcessingJob.status == STATUS_RUNNING).order_by(ProcessingJob.id)
+        ).scalars().all()
+        result = []
+        for job in jobs:
+            images = session.execute(
+                select(ProcessingImage).where(ProcessingImage.job_id == job.id).order_by(ProcessingImage.position)
+            ).scalars().all()
+            result.append((job, images))
+        return result
+
 def get_latest_unique_id(user_id: int):
     with SessionLocal() as session:
         # SELECT unique_id FROM `raw-data` WHERE user_id = %s ORDER BY id DESC LIMIT 1;
@@ -119,4 +241,6 @@ def insert_raw_data(vin_no: str, date_val, user_id: int):
         session.add(raw_data)
         session.commit()
         session.refresh(raw_data)
+        # Drop any cached "not found" for this ID
+        _record_cache.invalidate([raw_data.unique_id])
         return raw_data.unique_id
@@ -1,37 +1,195 @@
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import namedtuple
 from ultralytics import YOLO
+from app.config import (
+    DETECTION_MODEL_PATH, DETECTION_BACKEND, DETECTION_CASCADE, DETECTION_CASCADE_IMGSZ,
+    DETECTION_FULL_IMGSZ, DETECTION_CASCADE_CONF_BAND, DETECTION_CASCADE_AREA_BAND
+)
+from backend.services.image_buffer import SharedImageHandle, attach_shared_image
 
 CONF_THERSHOLD = 0.5
 AREA_THERSHOLD = 5000000
 
-_model = None
+# Per-image detection outcome: `found` drives the "Empty Skid" decision,
+# `boxes` holds the qualifying Chassis boxes (x1, y1, x2, y2), best first,
+# `decided_by` is the pass that produced it: "low" or "full" resolution.
+Detection = namedtuple("Detection", ["found", "boxes", "decided_by"], defaults=("full",))
+
+BACKENDS = ("torch", "onnx", "openvino", "onnx-int8")
+
+logger = logging.getLogger(__name__)
+
+_models = {}
+_export_lock = threading.Lock()
 
-def get_model():
-    global _model
-    if _model is None:
-        _model = YOLO('trained_models/esrsyolo11 1.pt')
-    return _model
+def backend_model_path(backend=DETECTION_BACKEND):
+    """Where the weights for `backend` live: the .pt itself or its export next to it."""
+    stem = os.path.splitext(DETECTION_MODEL_PATH)[0]
+    if backend == "torch":
+        return DETECTION_MODEL_PATH
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    if backend == "onnx-int8":
+        return stem + ".int8.onnx"
+    raise ValueError(f"Unknown detection backend {backend!r}, expected one of {BACKENDS}")
 
-def detect_vehicle(image_path, records):
-    model = get_model()
-    preds = model.predict(image_path)[0]
+def export_model(backend=DETECTION_BACKEND):
+    """
+    Export the .pt weights for `backend` unless already exported; returns
+    the model path. Exports use a dynamic batch axis so the pool's batched
+    predict() calls work unchanged.
+    """
+    path = backend_model_path(backend)
+    if backend == "onnx-int8":
+        # Needs calibration images, so it is never built implicitly
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; build it with quantize_detection.py calibrate")
+        return path
+    with _export_lock:
+        if not os.path.exists(path):
+            logger.info(f"Exporting {DETECTION_MODEL_PATH} to {backend}...")
+            exported = YOLO(DETECTION_MODEL_PATH).export(format=backend, dynamic=True)
+            if os.path.abspath(exported) != os.path.abspath(path):
+                os.replace(exported, path)
+            logger.info(f"Exported detection model to {path}")
+    return path
 
-    for box in preds.boxes:
-        conf = box.conf.item()
-        if conf < CONF_THERSHOLD:
-            continue
+def gate_report_path():
+    return backend_model_path("onnx-int8") + ".gate.json"
 
-        cls = int(box.cls.item())
-        label = model.names[cls]
-        if label != "Chassis":
-            continue
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
+def check_quantization_gate():
+    """
+    Refuse to activate the INT8 model unless the accuracy gate passed for
+    exactly this model file.
+    """
+    path = backend_model_path("onnx-int8")
+    try:
+        with open(gate_report_path()) as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        raise RuntimeError(f"No accuracy gate report for {path}; run quantize_detection.py gate")
+    if report.get("model_sha256") != file_sha256(path):
+        raise RuntimeError(f"Accuracy gate report is for a different build of {path}; re-run the gate")
+    if not report.get("passed"):
+        raise RuntimeError(f"INT8 model {path} failed its accuracy gate: {report.get('failures')}")
 
-        area = (x2 - x1) * (y2 - y1)
-        print("area: ",area)
-        print("area_threshold: ",AREA_THERSHOLD)
-        if area < AREA_THERSHOLD:
-            continue
+def get_model(backend=DETECTION_BACKEND):
+    if backend not in _models:
+        if backend == "onnx-int8":
+            check_quantization_gate()
+        # Exported models go through the same ultralytics predict/Results API
+        _models[backend] = YOLO(export_model(backend), task="detect")
+    return _models[backend]
 
+def init_worker(backend=DETECTION_BACKEND):
+    """
+    Process-pool initializer: load the model once when the worker starts
+    so the first image of every report does not pay the load time.
+    """
+    get_model(backend)
+
+def _chassis_class(model):
+    for cls, label in model.names.items():
+        if label == "Chassis":
+            return cls
+    return None
+
+def _is_ambiguous(preds, chassis_cls):
+    """
+    True when a low-resolution prediction is too close to a threshold to
+    trust: the best Chassis confidence is inside the band around
+    CONF_THERSHOLD, or a plausible Chassis box is near AREA_THERSHOLD.
+    """
+    boxes = preds.boxes
+    if chassis_cls is None or len(boxes) == 0:
+        return False
+    chassis = boxes.cls.long() == chassis_cls
+    if not bool(chassis.any()):
+        return False
+    conf = boxes.conf[chassis]
+    if abs(float(conf.max()) - CONF_THERSHOLD) <= DETECTION_CASCADE_CONF_BAND:
         return True
-    return False
+    xyxy = boxes.xyxy[chassis]
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    near_area = (area - AREA_THERSHOLD).abs() <= AREA_THERSHOLD * DETECTION_CASCADE_AREA_BAND
+    plausible = conf >= CONF_THERSHOLD - DETECTION_CASCADE_CONF_BAND
+    return bool((near_area & plausible).any())
+
+def _filter_chassis(preds, chassis_cls, decided_by="full"):
+    """
+    Keep Chassis boxes above the confidence and area thresholds using tensor
+    ops on the whole prediction instead of a per-box `.item()` loop.
+    """
+    boxes = preds.boxes
+    if chassis_cls is None or len(boxes) == 0:
+        return Detection(False, [], decided_by)
+
+    xyxy = boxes.xyxy.long()
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    keep = (boxes.conf >= CONF_THERSHOLD) & (boxes.cls.long() == chassis_cls) & (area >= AREA_THERSHOLD)
+    if not bool(keep.any()):
+        return Detection(False, [], decided_by)
+
+    order = boxes.conf[keep].argsort(descending=True)
+    kept = xyxy[keep][order].tolist()
+    return Detection(True, [tuple(box) for box in kept], decided_by)
+
+def _predict(model, sources, chassis_cls, cascade):
+    if not cascade:
+        preds = model.predict(sources, batch=len(sources), imgsz=DETECTION_FULL_IMGSZ, verbose=False)
+        return [_filter_chassis(p, chassis_cls) for p in preds]
+
+    preds = model.predict(sources, batch=len(sources), imgsz=DETECTION_CASCADE_IMGSZ, verbose=False)
+    results = [_filter_chassis(p, chassis_cls, "low") for p in preds]
+    ambiguous = [i for i, p in enumerate(preds) if _is_ambiguous(p, chassis_cls)]
+    if ambiguous:
+        full = model.predict([sources[i] for i in ambiguous], batch=len(ambiguous),
+                             imgsz=DETECTION_FULL_IMGSZ, verbose=False)
+        for i, p in zip(ambiguous, full):
+            results[i] = _filter_chassis(p, chassis_cls, "full")
+    return results
+
+def detect_vehicles(images, backend=DETECTION_BACKEND, cascade=DETECTION_CASCADE):
+    """
+    Batched detection: run N images (paths, decoded arrays or shared-memory
+    handles, possibly from different reports) through the model as a single
+    batch. Returns one Detection per image, in input order.
+    In cascade mode the batch runs at low resolution first and only the
+    ambiguous images are re-run at full resolution.
+    """
+    if not images:
+        return []
+    model = get_model(backend)
+    chassis_cls = _chassis_class(model)
+
+    sources, attached = [], []
+    try:
+        for image in images:
+            if isinstance(image, SharedImageHandle):
+                shm, array = attach_shared_image(image)
+                attached.append(shm)
+                sources.append(array)
+            else:
+                sources.append(image)
+        return _predict(model, sources, chassis_cls, cascade)
+    finally:
+        sources.clear()
+        for shm in attached:
+            shm.close()
+
+def detect_vehicle(image_path, records, backend=DETECTION_BACKEND):
+    return detect_vehicles([image_path], backend)[0].found
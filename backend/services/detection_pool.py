@@ -0,0 +1,174 @@
+# backend/services/detection_pool.py
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from app.config import DETECTION_POOL_WORKERS, DETECTION_BATCH_SIZE, DETECTION_BATCH_WAIT_MS
+from backend.services import detection
+
+logger = logging.getLogger(__name__)
+
+
+def _ping():
+    """No-op task used to force a worker to start (and run its initializer)."""
+    return True
+
+
+class DetectionPool:
+    """
+    App-lifetime pool of detection worker processes.
+
+    Every worker loads the YOLO model exactly once in its initializer, and
+    the pool is shared by all reports, so model RAM and startup cost are
+    bounded by `max_workers` instead of growing with concurrent reports.
+
+    Images submitted through `detect()` are grouped by a dispatcher thread
+    into batches of up to `batch_size` (waiting at most `batch_wait_ms`),
+    so one model.predict() call serves images from several reports.
+
+    If a worker dies (e.g. killed out of memory) the executor is broken for
+    good; it is then rebuilt and the batch retried once, so one bad batch
+    does not fail every later image until a restart.
+    """
+
+    def __init__(self, max_workers=DETECTION_POOL_WORKERS, batch_size=DETECTION_BATCH_SIZE,
+                 batch_wait_ms=DETECTION_BATCH_WAIT_MS):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        # Export ONNX/OpenVINO weights here, once, before workers race to load them
+        detection.export_model()
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._queue = queue.Queue()
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop, name="detection_batcher", daemon=True
+        )
+        self._dispatcher.start()
+
+    def _new_executor(self):
+        # spawn is required for CUDA/Torch compatibility
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=detection.init_worker,
+        )
+
+    def _rebuild(self, broken):
+        """Replace the executor `broken` (unless another thread already did); returns the current one."""
+        with self._executor_lock:
+            if self._executor is broken:
+                logger.error("Detection pool broken (a worker died); starting a new one")
+                broken.shutdown(wait=False)
+                self._executor = self._new_executor()
+            return self._executor
+
+    def warm_up(self):
+        """Start every worker and wait until each has loaded the model."""
+        futures = [self._executor.submit(_ping) for _ in range(self.max_workers)]
+        wait(futures)
+        logger.info(f"Detection pool warmed up with {self.max_workers} workers")
+
+    def detect_async(self, image):
+        """Queue one image for batched detection; resolves to a `Detection`."""
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def detect(self, image):
+        """Detect one image through the batcher and block for its `Detection`."""
+        return self.detect_async(image).result()
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the stop sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = self._collect_batch(item)
+            self._submit_batch([img for img, _ in batch], [f for _, f in batch])
+
+    def _submit_batch(self, images, futures, retry=True):
+        executor = self._executor
+        try:
+            pool_future = executor.submit(detection.detect_vehicles, images)
+        except BrokenProcessPool as e:
+            if retry:
+                self._rebuild(executor)
+                return self._submit_batch(images, futures, retry=False)
+            for f in futures:
+                f.set_exception(e)
+            return
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+            return
+        pool_future.add_done_callback(
+            lambda pf: self._fan_out(pf, executor, images, futures, retry)
+        )
+
+    def _fan_out(self, pool_future, executor, images, futures, retry):
+        try:
+            results = pool_future.result()
+        except BrokenProcessPool as e:
+            if retry:
+                self._rebuild(executor)
+                self._submit_batch(images, futures, retry=False)
+                return
+            for f in futures:
+                f.set_exception(e)
+            return
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+            return
+        for f, result in zip(futures, results):
+            f.set_result(result)
+
+    def shutdown(self, wait=True):
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_detection_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DetectionPool()
+        return _pool
+
+
+def shutdown_detection_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            logger.info("Shutting down detection pool...")
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -0,0 +1,102 @@
+# backend/services/fake_vision.py
+
+import time
+import zlib
+import string
+import logging
+import threading
+from concurrent import futures
+
+from google.cloud import vision
+
+logger = logging.getLogger(__name__)
+
+VISION_SERVICE = "google.cloud.vision.v1.ImageAnnotator"
+
+
+def fake_unique_id(content):
+    """The sticker ID the fake 'reads' from an image: derived from its bytes, so each image differs."""
+    crc = zlib.crc32(content)
+    letters = string.ascii_uppercase
+    return f"@{letters[crc % 26]}{letters[(crc // 26) % 26]}{1111 + (crc // 676) % 8889}"
+
+
+class FakeImageAnnotator:
+    """
+    Stand-in for Google's ImageAnnotator (Google ships no Vision emulator).
+
+    Every image is answered with one sticker ID (`fake_unique_id` of its
+    bytes) centred in the frame, after `rpc_ms` per call plus `image_ms` per
+    image, so batching and response fan-out can be exercised and timed
+    without credentials. Images whose ID is in `fail_ids` get a per-image
+    error, like Vision's partial failures. `calls` records each call's
+    batch size.
+    """
+
+    def __init__(self, rpc_ms=150, image_ms=20, fail_ids=()):
+        self.rpc_ms = rpc_ms
+        self.image_ms = image_ms
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, request):
+        with self._lock:
+            self.calls.append(len(request.requests))
+        time.sleep((self.rpc_ms + self.image_ms * len(request.requests)) / 1000)
+        return vision.BatchAnnotateImagesResponse(
+            responses=[self._annotate(r.image.content) for r in request.requests]
+        )
+
+    def _annotate(self, content):
+        unique_id = fake_unique_id(content)
+        if unique_id in self.fail_ids:
+            return vision.AnnotateImageResponse(error={"code": 3, "message": f"Bad image {unique_id}"})
+        box = vision.BoundingPoly(vertices=[{"x": 40, "y": 40}, {"x": 160, "y": 40},
+                                            {"x": 160, "y": 80}, {"x": 40, "y": 80}])
+        return vision.AnnotateImageResponse(text_annotations=[
+            vision.EntityAnnotation(description=unique_id, bounding_poly=box),  # full text
+            vision.EntityAnnotation(description=unique_id, bounding_poly=box),
+        ])
+
+
+class FakeVisionClient:
+    """
+    In-process client for OCRClient(client=...): the subset of
+    ImageAnnotatorClient the OCR client uses, answered by a FakeImageAnnotator.
+    """
+
+    def __init__(self, annotator=None):
+        self.annotator = annotator or FakeImageAnnotator()
+
+    def batch_annotate_images(self, requests):
+        return self.annotator.batch_annotate_images(vision.BatchAnnotateImagesRequest(requests=requests))
+
+    def text_detection(self, image):
+        request = vision.AnnotateImageRequest(
+            image=image, features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+        )
+        return self.batch_annotate_images([request]).responses[0]
+
+
+def serve(address="localhost:50051", annotator=None, max_workers=16):
+    """
+    Serve `annotator` over plaintext gRPC at `address`, for
+    VISION_EMULATOR_HOST. Returns the started grpc server; call stop() on it.
+    """
+    import grpc
+
+    annotator = annotator or FakeImageAnnotator()
+    handler = grpc.method_handlers_generic_handler(VISION_SERVICE, {
+        "BatchAnnotateImages": grpc.unary_unary_rpc_method_handler(
+            lambda request, context: annotator.batch_annotate_images(request),
+            request_deserializer=vision.BatchAnnotateImagesRequest.deserialize,
+            response_serializer=vision.BatchAnnotateImagesResponse.serialize,
+        ),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(address)
+    server.start()
+    logger.info(f"Fake Vision endpoint listening on {address}")
+    return server
@@ -1,23 +1,289 @@
 from google.cloud import vision
 import os
 import cv2
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image
 
+from backend.services.image_buffer import ImageBuffer
+
+from app.config import (
+    OCR_BATCH_MODE, OCR_BATCH_SIZE, OCR_BATCH_FLUSH_MS, OCR_BATCH_MAX_BYTES,
+    OCR_BATCH_CONCURRENCY, VISION_EMULATOR_HOST, OCR_MAX_PAYLOAD_BYTES,
+    OCR_MAX_PIXELS, OCR_MAX_EDGE, OCR_JPEG_QUALITY, OCR_CROP_MARGIN, OCR_CROP_MAX_FRACTION,
+    OCR_PROGRESSIVE, OCR_PROGRESSIVE_MAX_EDGE
+)
+
+logger = logging.getLogger(__name__)
+
+# Hard limit of images per batch_annotate_images request
+VISION_MAX_BATCH = 16
+
+# Formats Vision accepts as-is, so the original bytes can be sent untouched.
+# Pillow reports DJI drone JPEGs (with an embedded preview) as MPO; their
+# bytes are a valid JPEG.
+VISION_PASSTHROUGH_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "BMP", "GIF"}
+
+
+def make_vision_client():
+    """
+    Build the Vision client. When VISION_EMULATOR_HOST is set, talk plaintext
+    gRPC to that local fake endpoint (see fake_vision.serve) instead of Google.
+    """
+    if VISION_EMULATOR_HOST:
+        import grpc
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+
+        channel = grpc.insecure_channel(VISION_EMULATOR_HOST)
+        transport = ImageAnnotatorGrpcTransport(channel=channel, credentials=AnonymousCredentials())
+        return vision.ImageAnnotatorClient(transport=transport)
+    return vision.ImageAnnotatorClient()
+
+
 class OCRClient:
-        
-    def __init__(self):
+
+    def __init__(self, client=None, batch_mode=OCR_BATCH_MODE, batch_size=OCR_BATCH_SIZE,
+                 flush_ms=OCR_BATCH_FLUSH_MS, progressive=OCR_PROGRESSIVE):
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = 'GoogleVisionCredential.json'
-        self.client = vision.ImageAnnotatorClient()
-    
-    def get_annotations(self, image_path):
-        image = cv2.imread(image_path)
-        _, encoded_image = cv2.imencode('.png', image)
-        content = encoded_image.tobytes()
+        self.client = client or make_vision_client()
+        self.batch_mode = batch_mode
+        self.batch_size = max(1, min(batch_size, VISION_MAX_BATCH))
+        self.flush_ms = flush_ms
+        self.progressive = progressive
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "images": 0,
+            "passthrough": 0,
+            "reencoded": 0,
+            "cropped": 0,
+            "downscaled": 0,
+            "bytes_original": 0,
+            "bytes_sent": 0,
+            "encode_ms": 0.0,
+            # Progressive mode: images tried at low resolution first, how many
+            # of them needed the full-resolution fallback, and the net bytes
+            # saved against sending the original file
+            "progressive_images": 0,
+            "progressive_fallbacks": 0,
+            "progressive_bytes_saved": 0,
+        }
+
+        if self.batch_mode:
+            self._queue = queue.Queue()
+            self._senders = ThreadPoolExecutor(
+                max_workers=OCR_BATCH_CONCURRENCY, thread_name_prefix="ocr_batch_"
+            )
+            self._flusher = threading.Thread(target=self._flush_loop, name="ocr_batcher", daemon=True)
+            self._flusher.start()
+
+    def _is_passthrough(self, buffer):
+        if buffer.size > OCR_MAX_PAYLOAD_BYTES:
+            return False
+        try:
+            # Reads the header only; pixels are not decoded
+            with Image.open(buffer.path) as img:
+                return img.format in VISION_PASSTHROUGH_FORMATS and img.width * img.height <= OCR_MAX_PIXELS
+        except Exception:
+            return False
+
+    @staticmethod
+    def _to_jpeg(image, max_edge=OCR_MAX_EDGE):
+        h, w = image.shape[:2]
+        scale = max_edge / max(h, w)
+        if scale < 1:
+            image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        _, encoded_image = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, OCR_JPEG_QUALITY])
+        return encoded_image.tobytes()
+
+    @staticmethod
+    def _crop_regions(pixels, regions):
+        """
+        Crop each (x1, y1, x2, y2) region grown by OCR_CROP_MARGIN and stack
+        the crops vertically into one mosaic. Returns None when the crops
+        would cover most of the frame anyway.
+        """
+        h, w = pixels.shape[:2]
+        crops = []
+        for x1, y1, x2, y2 in regions:
+            mx = int((x2 - x1) * OCR_CROP_MARGIN)
+            my = int((y2 - y1) * OCR_CROP_MARGIN)
+            x1, y1 = max(0, x1 - mx), max(0, y1 - my)
+            x2, y2 = min(w, x2 + mx), min(h, y2 + my)
+            if x2 > x1 and y2 > y1:
+                crops.append(pixels[y1:y2, x1:x2])
+        if not crops or sum(c.shape[0] * c.shape[1] for c in crops) > OCR_CROP_MAX_FRACTION * h * w:
+            return None
+        if len(crops) == 1:
+            return crops[0]
+        width = max(c.shape[1] for c in crops)
+        mosaic = np.zeros((sum(c.shape[0] for c in crops), width, 3), dtype=pixels.dtype)
+        y = 0
+        for crop in crops:
+            mosaic[y:y + crop.shape[0], :crop.shape[1]] = crop
+            y += crop.shape[0]
+        return mosaic
+
+    def _encode(self, buffer, regions=None):
+        """
+        Payload policy: with `regions`, a JPEG mosaic of just those regions;
+        otherwise the original compressed bytes when Vision accepts them
+        as-is, or else a JPEG resized so its longest edge is at most
+        OCR_MAX_EDGE.
+        """
+        start = time.perf_counter()
+        size = buffer.size
+
+        mosaic = self._crop_regions(buffer.pixels(), regions) if regions else None
+        if mosaic is not None:
+            content = self._to_jpeg(mosaic)
+            kind = "cropped"
+        elif self._is_passthrough(buffer):
+            content = bytes(buffer.raw)
+            kind = "passthrough"
+        else:
+            # Reuses the pipeline's decoded pixels instead of decoding again
+            content = self._to_jpeg(buffer.pixels())
+            kind = "reencoded"
+
+        encode_ms = (time.perf_counter() - start) * 1000
+        self._record(size, len(content), encode_ms, kind)
+        logger.debug(
+            f"OCR payload {buffer.name}: {len(content)} bytes sent "
+            f"(original {size}), {kind}, {encode_ms:.1f} ms"
+        )
+        return content
+
+    def _encode_downscaled(self, buffer, regions=None):
+        """
+        First-pass payload for progressive mode: the same pixels `_encode`
+        would send, as a JPEG with its longest edge at most
+        OCR_PROGRESSIVE_MAX_EDGE. Returns (content, encode_ms), or None when
+        they are already that small. Not recorded here: an image is counted
+        once, with the payload that finally answered it.
+        """
+        start = time.perf_counter()
+        pixels = buffer.pixels()
+        source = self._crop_regions(pixels, regions) if regions else None
+        if source is None:
+            source = pixels
+        if max(source.shape[:2]) <= OCR_PROGRESSIVE_MAX_EDGE:
+            return None
+        content = self._to_jpeg(source, OCR_PROGRESSIVE_MAX_EDGE)
+        return content, (time.perf_counter() - start) * 1000
+
+    def _record(self, original_bytes, sent_bytes, encode_ms, kind):
+        with self._stats_lock:
+            self.stats["images"] += 1
+            self.stats[kind] += 1
+            self.stats["bytes_original"] += original_bytes
+            self.stats["bytes_sent"] += sent_bytes
+            self.stats["encode_ms"] += encode_ms
+
+    def _record_progressive(self, bytes_saved, fallback):
+        with self._stats_lock:
+            self.stats["progressive_images"] += 1
+            self.stats["progressive_fallbacks"] += int(fallback)
+            self.stats["progressive_bytes_saved"] += bytes_saved
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        tried = stats["progressive_images"]
+        stats["progressive_fallback_rate"] = round(stats["progressive_fallbacks"] / tried, 3) if tried else 0.0
+        return stats
+
+    def get_annotations(self, image, regions=None, accept=None):
+        """
+        `image` is an ImageBuffer shared with the other stages, or a file path.
+        `regions` optionally limits OCR to those (x1, y1, x2, y2) boxes.
+        In progressive mode, `accept(annotations)` decides whether the
+        low-resolution result is good enough; without it the image is sent
+        at full resolution straight away.
+        """
+        if isinstance(image, ImageBuffer):
+            return self._annotate(image, regions, accept)
+        with ImageBuffer(image) as buffer:
+            return self._annotate(buffer, regions, accept)
+
+    def _annotate(self, buffer, regions, accept):
+        if self.progressive and accept is not None:
+            downscaled = self._encode_downscaled(buffer, regions)
+            if downscaled is not None:
+                content, encode_ms = downscaled
+                annotations = self._request(content)
+                if accept(annotations):
+                    self._record(buffer.size, len(content), encode_ms, "downscaled")
+                    self._record_progressive(buffer.size - len(content), fallback=False)
+                    return annotations
+                logger.debug(f"No unique ID in downscaled {buffer.name}, retrying at full resolution")
+                self._record_progressive(-len(content), fallback=True)
+        return self._request(self._encode(buffer, regions))
+
+    def _request(self, content):
+        if self.batch_mode:
+            # Wait for the batcher to send this image with others in flight
+            future = Future()
+            self._queue.put((content, future))
+            return future.result()
 
         # Send to Google Vision
         response = self.client.text_detection(image=vision.Image(content=content))
         return response.text_annotations
 
+    def _collect_batch(self, first):
+        batch = [first]
+        batch_bytes = len(first[0])
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if batch_bytes + len(item[0]) > OCR_BATCH_MAX_BYTES:
+                # Too big for this request; start the next batch with it
+                self._queue.put(item)
+                break
+            batch.append(item)
+            batch_bytes += len(item[0])
+        return batch
+
+    def _flush_loop(self):
+        while True:
+            batch = self._collect_batch(self._queue.get())
+            self._senders.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(content=content),
+                features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+            )
+            for content, _ in batch
+        ]
+        try:
+            response = self.client.batch_annotate_images(requests=requests)
+        except Exception as e:
+            logger.error(f"Vision batch of {len(batch)} images failed: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        logger.debug(f"Vision batch of {len(batch)} images annotated")
+        # Responses come back in request order; fan them out to the waiters
+        for (_, future), image_response in zip(batch, response.responses):
+            if image_response.error.message:
+                future.set_exception(RuntimeError(image_response.error.message))
+            else:
+                future.set_result(image_response.text_annotations)
+
 
 # if __name__ == '__main__':
 #     ocr_client = OCRClient()
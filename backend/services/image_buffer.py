@@ -0,0 +1,103 @@
+# backend/services/image_buffer.py
+
+import os
+import mmap
+import hashlib
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# Picklable reference to decoded pixels in shared memory. Detection workers
+# receive this instead of a file path and map the same pixels without copying.
+SharedImageHandle = namedtuple("SharedImageHandle", ["shm_name", "shape", "dtype"])
+
+
+class ImageBuffer:
+    """
+    One uploaded image, read and decoded once for the whole pipeline.
+
+    - `raw` is a zero-copy view of the file's compressed bytes (memory-mapped)
+    - `pixels()` decodes the image once into a shared-memory block
+    - `shared_handle()` lets another process attach to those pixels
+    - `reader()` gives a fresh file-like view of `raw` for streaming uploads
+    - `content_hash` is the sha256 of the file, computed lazily unless the
+      ingest path already hashed the bytes while writing them
+
+    Call `close()` (or use as a context manager) once every stage is done;
+    it releases the mapping and unlinks the shared-memory block.
+    """
+
+    def __init__(self, image_path, content_hash=None):
+        self.path = image_path
+        self.name = os.path.basename(image_path)
+        self._file = open(image_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._lock = threading.Lock()
+        self._shm = None
+        self._pixels = None
+        self._content_hash = content_hash
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self._mmap).hexdigest()
+        return self._content_hash
+
+    @property
+    def raw(self):
+        return memoryview(self._mmap)
+
+    @property
+    def size(self):
+        return len(self._mmap)
+
+    def reader(self):
+        """Independent read-only file object over the same mapped pages."""
+        return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def pixels(self):
+        """Decoded BGR pixels, decoded on first use and shared afterwards."""
+        with self._lock:
+            if self._pixels is None:
+                decoded = cv2.imdecode(np.frombuffer(self._mmap, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if decoded is None:
+                    raise ValueError(f"Could not decode image {self.name}")
+                self._shm = shared_memory.SharedMemory(create=True, size=decoded.nbytes)
+                self._pixels = np.ndarray(decoded.shape, dtype=decoded.dtype, buffer=self._shm.buf)
+                self._pixels[:] = decoded
+            return self._pixels
+
+    def shared_handle(self):
+        pixels = self.pixels()
+        return SharedImageHandle(self._shm.name, pixels.shape, pixels.dtype.str)
+
+    def close(self):
+        with self._lock:
+            self._pixels = None
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_shared_image(handle):
+    """
+    Map the pixels behind a SharedImageHandle in this process.
+    Returns (shm, array); call shm.close() when done with the array.
+    """
+    # Spawned workers share the parent's resource tracker, so attaching only
+    # re-registers a name it already holds; the creator's unlink() drops it.
+    shm = shared_memory.SharedMemory(name=handle.shm_name)
+    array = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+    return shm, array
@@ -0,0 +1,364 @@
+# backend/services/pipeline.py
+
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+
+from app.config import (
+    PIPELINE_QUEUE_SIZE, PIPELINE_STAGE_WORKERS, PIPELINE_DETECTION_FIRST, OCR_CROP_TO_DETECTIONS,
+    OCR_QR_FIRST
+)
+from backend.services.google_ocr import OCRClient
+from backend.services.annotations_parser import AnnotationsParser
+from backend.services.qr_decoder import QRDecoder
+from backend.services.json_result import build_result
+from backend.services.s3_operator import upload_images, get_uploader
+from backend.services.detection_pool import get_detection_pool
+from backend.services.image_buffer import ImageBuffer
+from backend.services.data_manager import get_records
+from backend.services.result_writer import get_inference_writer
+from backend.services import result_cache
+
+logger = logging.getLogger(__name__)
+
+ocr_client = OCRClient()
+parser = AnnotationsParser()
+qr_decoder = QRDecoder()
+
+
+class ImageJob:
+    """
+    One image travelling through the pipeline. Stages fill in its fields;
+    `future` resolves to (success, saved_count) once its rows are durable.
+    """
+
+    def __init__(self, image_path, report_id, user_id, idx, total, content_hash=None, image_id=None,
+                 s3_key=None):
+        self.image_path = image_path
+        self.name = os.path.basename(image_path)
+        self.report_id = report_id
+        self.user_id = user_id
+        self.idx = idx
+        self.total = total
+        self.content_hash = content_hash
+        self.image_id = image_id  # processing_images row, checkpointed with the results
+
+        self.buffer = None
+        self.cache_key = None
+        self.cached = False
+        self.unique_ids = []
+        self.records = []
+        self.qr_records = {}  # unique_id -> StickerRecord decoded from a sticker QR
+        self.detection = None
+        self.boxes = []  # qualifying Chassis boxes from detection
+        self.detection_pass = None  # "low" or "full": the pass that decided detection
+        self.s3_key = s3_key  # preset when the browser already uploaded the image to S3
+        self.s3_url = None
+        self.rows = []  # inference rows handed to the writer
+        self.future = Future()
+
+    def release(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+
+class Stage:
+    """
+    A pipeline stage: `workers` threads pulling jobs from a bounded queue,
+    running `fn(job)` and forwarding the job to the next stage. A full queue
+    blocks the previous stage, which is what keeps memory flat.
+    """
+
+    def __init__(self, name, fn, workers, queue_size, on_error):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next = None
+        self.on_error = on_error
+
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+        self.peak_depth = 0
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"stage_{name}_{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, job):
+        self.queue.put(job)
+        depth = self.queue.qsize()
+        with self._lock:
+            self.peak_depth = max(self.peak_depth, depth)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.fn(job)
+                failed = False
+            except Exception as e:
+                failed = True
+                self.on_error(job, self.name, e)
+            self._record(time.perf_counter() - start, failed)
+            if not failed and self.next is not None:
+                self.next.put(job)
+
+    def _record(self, seconds, failed):
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+            self.busy_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self):
+        with self._lock:
+            done = self.processed + self.failed
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "peak_depth": self.peak_depth,
+                "processed": self.processed,
+                "failed": self.failed,
+                "avg_ms": round(self.busy_seconds / done * 1000, 1) if done else 0.0,
+                "max_ms": round(self.max_seconds * 1000, 1),
+            }
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class ImagePipeline:
+    """
+    App-lifetime staged pipeline shared by all reports:
+
+        prepare -> ocr -> lookup -> detect -> upload -> db
+
+    or, in detection-first mode, where Empty Skid images skip OCR and lookup:
+
+        prepare -> detect -> ocr -> lookup -> upload -> db
+
+    Network-bound stages (Vision, MySQL, S3) and the CPU-bound detect stage
+    run on separate workers, so different images overlap across stages.
+    """
+
+    def __init__(self, stage_workers=PIPELINE_STAGE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 detection_first=PIPELINE_DETECTION_FIRST, qr_first=OCR_QR_FIRST):
+        self.detection_pool = get_detection_pool()
+        self.writer = get_inference_writer()
+        self.detection_first = detection_first
+        self.qr_first = qr_first
+        # Cropping needs the boxes, so it only applies when detection runs first
+        self.crop_to_detections = detection_first and OCR_CROP_TO_DETECTIONS
+        self._counters_lock = threading.Lock()
+        self.counters = {
+            "ocr_calls": 0,
+            "ocr_seconds": 0.0,
+            "ocr_skipped_empty": 0,
+            "ocr_skipped_qr": 0,
+            # Which detection pass decided each image (cascade mode uses both)
+            "detect_decided_low": 0,
+            "detect_decided_full": 0,
+        }
+        if detection_first:
+            order = ["prepare", "detect", "ocr", "lookup", "upload", "db"]
+        else:
+            order = ["prepare", "ocr", "lookup", "detect", "upload", "db"]
+        handlers = {
+            "prepare": self._prepare,
+            "ocr": self._ocr,
+            "lookup": self._lookup,
+            "detect": self._detect,
+            "upload": self._upload,
+            "db": self._save,
+        }
+        steps = [(name, handlers[name]) for name in order]
+        self.stages = [
+            Stage(name, fn, stage_workers[name], queue_size, self._fail)
+            for name, fn in steps
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+
+    def submit(self, job):
+        """Queue an image; blocks while the first stage is full."""
+        self.stages[0].put(job)
+        return job.future
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def counter_stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        # Savings are estimated from the average latency of OCR calls actually made
+        avg_ocr = counters["ocr_seconds"] / counters["ocr_calls"] if counters["ocr_calls"] else 0.0
+        counters["ocr_avg_ms"] = round(avg_ocr * 1000, 1)
+        counters["ocr_saved_ms_estimate"] = round(counters["ocr_skipped_empty"] * avg_ocr * 1000, 1)
+        return counters
+
+    def shutdown(self):
+        # Stop front to back so every stage drains into the next one first
+        for stage in self.stages:
+            stage.stop()
+
+    # ---------- stages ----------
+
+    def _prepare(self, job):
+        logger.info(f"User {job.user_id}: Processing image {job.idx}/{job.total}: {job.name}")
+        # Read/decode the file once; every later stage reuses this buffer
+        job.buffer = ImageBuffer(job.image_path, content_hash=job.content_hash)
+        job.cache_key = result_cache.cache_key(job.buffer.content_hash)
+        cached = result_cache.lookup(job.cache_key)
+        if cached:
+            logger.info(f"User {job.user_id}: Image {job.name} served from result cache")
+            job.cached = True
+            job.unique_ids, job.detection = cached.unique_ids, cached.detection_found
+            job.qr_records = cached.qr_records
+            if job.s3_key:
+                # Uploaded straight to S3 by the browser: link that object and
+                # take only the OCR / detection results from the cache
+                job.s3_url = get_uploader().object_url(job.s3_key)
+            else:
+                job.s3_key, job.s3_url = cached.s3_key, cached.s3_url
+
+    def _ocr(self, job):
+        if job.cached:
+            return
+        if self.detection_first and not job.detection:
+            # Empty Skid: the result does not depend on any sticker text
+            self._count("ocr_skipped_empty")
+            return
+        if self.qr_first:
+            stickers = qr_decoder.decode(job.buffer.pixels())
+            if stickers:
+                # Read locally from the sticker QR: no Vision call needed
+                self._count("ocr_skipped_qr")
+                job.unique_ids = [(record.unique_id, center) for record, center in stickers]
+                job.qr_records = {record.unique_id: record for record, _ in stickers}
+                return
+        start = time.perf_counter()
+        regions = job.boxes if self.crop_to_detections else None
+        # In progressive mode, a low-resolution pass is enough once it yields an ID
+        annotations = ocr_client.get_annotations(
+            job.buffer, regions, accept=lambda result: bool(parser.get_unique_ids(result))
+        )
+        self._count("ocr_calls")
+        self._count("ocr_seconds", time.perf_counter() - start)
+        job.unique_ids = parser.get_unique_ids(annotations)
+
+    def _lookup(self, job):
+        # One cached / batched raw-data lookup for every ID in the image
+        # whose VIN did not already come from its sticker QR
+        found = get_records([uid for uid, _ in job.unique_ids if uid not in job.qr_records])
+        found.update(job.qr_records)
+        job.records = [found[unique_id[0]] for unique_id in job.unique_ids]
+
+    def _detect(self, job):
+        if job.cached:
+            return
+        # Pixels go to the shared detection pool by shared-memory handle;
+        # the pool batches this image with others in flight from any report
+        detection = self.detection_pool.detect(job.buffer.shared_handle())
+        job.detection, job.boxes = detection.found, detection.boxes
+        job.detection_pass = detection.decided_by
+        self._count(f"detect_decided_{detection.decided_by}")
+        logger.info(f"User {job.user_id}: Image {job.name} detection decided by {detection.decided_by}-resolution pass")
+
+    def _upload(self, job):
+        if not job.cached:
+            if job.s3_key:
+                # Uploaded straight to S3 from the browser; no second upload
+                job.s3_url = get_uploader().object_url(job.s3_key)
+            else:
+                job.s3_key, job.s3_url = upload_images(job.buffer)
+            result_cache.store(job.cache_key, job.buffer.content_hash, job.unique_ids,
+                               job.detection, job.s3_key, job.s3_url, job.qr_records)
+        job.release()
+
+    def _save(self, job):
+        results = build_result(job.name, job.records, job.detection)
+        rows = [
+            dict(
+                report_id=job.report_id,
+                user_id=job.user_id,
+                image_name=result.get("IMG_NAME", ""),
+                unique_id=result.get("UNIQUE_ID", ""),
+                quantity=result.get("QUANTITY", 1),
+                vin_no=result.get("VIN_NO", ""),
+                exclusion=result.get("EXCLUSION", ""),
+                s3_obj_url=job.s3_url,
+                createdAt=datetime.now()
+            )
+            for result in results
+        ]
+        job.rows = rows
+        # Don't hold a db worker while the group commit is pending; the
+        # job completes when the writer acknowledges its rows
+        self.writer.submit(rows, job.image_id).add_done_callback(lambda f: self._saved(job, f))
+
+    def _saved(self, job, write_future):
+        try:
+            saved_count = write_future.result()
+        except Exception as e:
+            self._fail(job, "db", e)
+            return
+        logger.info(f"User {job.user_id}: ✅ Image {job.idx}/{job.total} complete ({saved_count} results)")
+        job.future.set_result((True, saved_count))
+
+    def _fail(self, job, stage_name, error):
+        logger.error(f"User {job.user_id}: ❌ Error processing image {job.name} in {stage_name} stage: {str(error)}")
+        job.release()
+        job.future.set_result((False, 0))
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ImagePipeline()
+        return _pipeline
+
+
+def get_pipeline_counters():
+    """Counters of the running pipeline, or None; unlike get_pipeline() it never creates one."""
+    pipeline = _pipeline
+    return pipeline.counter_stats() if pipeline is not None else None
+
+
+def shutdown_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            logger.info("Shutting down image pipeline...")
+            _pipeline.shutdown()
+            _pipeline = None
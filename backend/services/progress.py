@@ -0,0 +1,52 @@
+# backend/services/progress.py
+
+import json
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressBus:
+    """
+    In-process pub/sub for report processing events.
+
+    Pipeline and scheduler threads `publish()`; each SSE connection
+    `subscribe()`s with its event loop and receives (event, data) tuples on
+    an asyncio.Queue, delivered thread-safely via call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # report_id -> list of (loop, asyncio.Queue)
+
+    def subscribe(self, report_id, loop):
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(report_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, report_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(report_id, [])
+            self._subscribers[report_id] = [s for s in subscribers if s[1] is not queue]
+            if not self._subscribers[report_id]:
+                del self._subscribers[report_id]
+
+    def publish(self, report_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(report_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+            except RuntimeError:
+                # The subscriber's loop is closed; it will unsubscribe itself
+                pass
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+progress_bus = ProgressBus()
@@ -0,0 +1,52 @@
+# backend/services/qr_decoder.py
+
+import logging
+import threading
+
+import cv2
+
+from backend.services.qr_payload import parse_payload
+
+logger = logging.getLogger(__name__)
+
+
+class QRDecoder:
+    """
+    Local sticker reader: finds every QR code in an already-decoded frame
+    and parses our sticker payloads, so Vision is only needed when no
+    sticker QR is readable.
+    """
+
+    def __init__(self):
+        # One detector per thread: cv2 detectors are not safe to share
+        self._local = threading.local()
+
+    def _detector(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.QRCodeDetector()
+        return detector
+
+    def decode(self, pixels):
+        """
+        Returns [(StickerRecord, (x, y))] for each distinct sticker QR in
+        `pixels` (BGR), with the QR centre in the same form as
+        AnnotationsParser coordinates.
+        """
+        try:
+            ok, texts, points, _ = self._detector().detectAndDecodeMulti(pixels)
+        except cv2.error as e:
+            logger.warning(f"QR decode failed: {str(e)}")
+            return []
+        if not ok:
+            return []
+
+        stickers, seen = [], set()
+        for text, corners in zip(texts, points):
+            record = parse_payload(text) if text else None
+            if record is None or record.unique_id in seen:
+                continue
+            seen.add(record.unique_id)
+            center = (float(corners[:, 0].mean()), float(corners[:, 1].mean()))
+            stickers.append((record, center))
+        return stickers
@@ -13,6 +13,7 @@ from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from backend.services.data_manager import insert_raw_data
+from backend.services.qr_payload import encode_payload
 
 def draw_qr_page(c, vin_no, unique_id):
     """
@@ -36,7 +37,7 @@ def draw_qr_page(c, vin_no, unique_id):
     # ---- QR CODE ----
     qr_size = 180 * mm  # large QR
     qr = qrcode.QRCode(box_size=10, border=1)
-    qr.add_data(f"VIN NO: {vin_no} UNIQUE ID: {unique_id}")
+    qr.add_data(encode_payload(vin_no, unique_id))
     qr.make()
     img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
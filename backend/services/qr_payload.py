@@ -0,0 +1,55 @@
+# backend/services/qr_payload.py
+
+import binascii
+from collections import namedtuple
+
+import regex
+
+from app.config import QR_PAYLOAD_FORMAT
+
+# What a sticker QR tells us: enough for build_result without a raw-data lookup
+StickerRecord = namedtuple("StickerRecord", ["unique_id", "vin_no"])
+
+# Original payload: "VIN NO: <vin> UNIQUE ID: <@XX9999>"
+LEGACY_PAYLOAD = regex.compile(r'^VIN NO:\s*(.*?)\s*UNIQUE ID:\s*(@[A-Z]{2}\d{4})\s*$')
+
+# Compact payload: "E1:<XX9999>:<vin>:<crc>". Prefix "E" + format version,
+# the unique ID without its "@", the VIN (may be empty, as in the legacy
+# form), and a CRC-16/CCITT of everything before it as 4 hex digits. For the
+# usual upper-case VINs every character is in the QR alphanumeric set, which
+# needs fewer modules than byte mode, so the same printed size gives larger,
+# easier-to-scan modules.
+COMPACT_PREFIX = "E"
+COMPACT_VERSION = "1"
+COMPACT_PAYLOAD = regex.compile(r'^E(\d+):([A-Z]{2}\d{4}):(.*):([0-9A-F]{4})$')
+
+
+def _checksum(body):
+    return format(binascii.crc_hqx(body.encode(), 0xFFFF), "04X")
+
+
+def encode_payload(vin_no, unique_id, payload_format=QR_PAYLOAD_FORMAT):
+    """Text to put in a sticker QR, in the configured format."""
+    if payload_format == "legacy":
+        return f"VIN NO: {vin_no} UNIQUE ID: {unique_id}"
+    body = f"{COMPACT_PREFIX}{COMPACT_VERSION}:{unique_id.lstrip('@')}:{vin_no}"
+    return f"{body}:{_checksum(body)}"
+
+
+def parse_payload(text):
+    """
+    StickerRecord for a sticker QR payload in either format, or None when
+    it is not one of ours (or fails its checksum).
+    """
+    text = text.strip()
+    match = COMPACT_PAYLOAD.match(text)
+    if match:
+        version, unique_id, vin_no, checksum = match.groups()
+        if version != COMPACT_VERSION or _checksum(text[:-5]) != checksum:
+            return None
+        return StickerRecord(unique_id=f"@{unique_id}", vin_no=vin_no)
+
+    match = LEGACY_PAYLOAD.match(text)
+    if match:
+        return StickerRecord(unique_id=match.group(2), vin_no=match.group(1))
+    return None
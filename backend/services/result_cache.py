@@ -0,0 +1,121 @@
+# backend/services/result_cache.py
+
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from collections import namedtuple
+
+from sqlalchemy import select, delete, update
+
+from app.config import (
+    DETECTION_MODEL_VERSION, DETECTION_FULL_IMGSZ, DETECTION_CASCADE, DETECTION_CASCADE_IMGSZ,
+    DETECTION_CASCADE_CONF_BAND, DETECTION_CASCADE_AREA_BAND, PIPELINE_DETECTION_FIRST, RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_AGE_DAYS, RESULT_CACHE_EVICT_EVERY
+)
+from backend.database import SessionLocal
+from backend.models.image_result_cache import ImageResultCache
+from backend.services.detection import CONF_THERSHOLD, AREA_THERSHOLD
+from backend.services.qr_payload import StickerRecord
+
+logger = logging.getLogger(__name__)
+
+# `qr_records` (unique_id -> StickerRecord) keeps VINs read from sticker QRs,
+# so a cache hit resolves them the same way instead of via raw data
+CachedResult = namedtuple("CachedResult", ["unique_ids", "detection_found", "s3_key", "s3_url", "qr_records"])
+
+_store_count = 0
+_store_lock = threading.Lock()
+
+
+def cache_key(content_hash):
+    """Key an image's content hash by everything that can change its result."""
+    parts = [content_hash, DETECTION_MODEL_VERSION, f"conf={CONF_THERSHOLD}", f"area={AREA_THERSHOLD}",
+             f"imgsz={DETECTION_FULL_IMGSZ}",
+             # Detection-first stores Empty Skids without their sticker IDs
+             f"detection_first={PIPELINE_DETECTION_FIRST}"]
+    if DETECTION_CASCADE:
+        # A low-resolution pass may decide the image on its own
+        parts += [f"cascade_imgsz={DETECTION_CASCADE_IMGSZ}", f"conf_band={DETECTION_CASCADE_CONF_BAND}",
+                  f"area_band={DETECTION_CASCADE_AREA_BAND}"]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def lookup(key):
+    """Return the CachedResult for `key` (and mark it used), or None."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with SessionLocal() as session:
+        entry = session.execute(
+            select(ImageResultCache).where(ImageResultCache.cache_key == key)
+        ).scalars().first()
+        if entry is None:
+            return None
+        session.execute(
+            update(ImageResultCache)
+            .where(ImageResultCache.id == entry.id)
+            .values(hits=ImageResultCache.hits + 1, lastUsedAt=datetime.now())
+        )
+        session.commit()
+        # Entries are [uid, coord], plus the VIN when it came from the sticker QR
+        unique_ids, qr_records = [], {}
+        for item in json.loads(entry.unique_ids or "[]"):
+            uid, coord = item[0], item[1]
+            unique_ids.append((uid, tuple(coord) if coord else None))
+            if len(item) > 2:
+                qr_records[uid] = StickerRecord(unique_id=uid, vin_no=item[2])
+        return CachedResult(unique_ids, entry.detection_found, entry.s3_key, entry.s3_obj_url, qr_records)
+
+
+def store(key, content_hash, unique_ids, detection_found, s3_key, s3_url, qr_records=None):
+    """Remember an image's result. Failures are logged, never raised."""
+    global _store_count
+    if not RESULT_CACHE_ENABLED:
+        return
+    now = datetime.now()
+    try:
+        with SessionLocal() as session:
+            session.add(ImageResultCache(
+                cache_key=key,
+                content_hash=content_hash,
+                unique_ids=json.dumps([
+                    [uid, coord, qr_records[uid].vin_no] if qr_records and uid in qr_records else [uid, coord]
+                    for uid, coord in unique_ids
+                ]),
+                detection_found=bool(detection_found),
+                s3_key=s3_key,
+                s3_obj_url=s3_url,
+                hits=0,
+                createdAt=now,
+                lastUsedAt=now,
+            ))
+            session.commit()
+    except Exception as e:
+        # Most likely a concurrent store of the same image; the other row wins
+        logger.warning(f"Result cache: could not store {content_hash[:12]}: {str(e)}")
+        return
+
+    with _store_lock:
+        _store_count += 1
+        run_eviction = _store_count % RESULT_CACHE_EVICT_EVERY == 0
+    if run_eviction:
+        evict()
+
+
+def evict():
+    """Drop entries older than the max age, then the least recently used beyond the max size."""
+    cutoff = datetime.now() - timedelta(days=RESULT_CACHE_MAX_AGE_DAYS)
+    with SessionLocal() as session:
+        expired = session.execute(
+            delete(ImageResultCache).where(ImageResultCache.lastUsedAt < cutoff)
+        ).rowcount
+        keep_ids = select(ImageResultCache.id).order_by(ImageResultCache.lastUsedAt.desc()).limit(RESULT_CACHE_MAX_ENTRIES)
+        # MySQL cannot LIMIT inside IN (...) directly; wrap it in a derived table
+        keep = keep_ids.subquery()
+        overflow = session.execute(
+            delete(ImageResultCache).where(ImageResultCache.id.not_in(select(keep.c.id)))
+        ).rowcount
+        session.commit()
+    if expired or overflow:
+        logger.info(f"Result cache: evicted {expired} expired and {overflow} least-recently-used entries")
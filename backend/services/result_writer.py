@@ -0,0 +1,123 @@
+# backend/services/result_writer.py
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+from app.config import INFERENCE_WRITER_FLUSH_ROWS, INFERENCE_WRITER_FLUSH_MS
+from backend.services.data_manager import insert_inferences
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceWriter:
+    """
+    Single group-commit writer for inference rows.
+
+    Pipelines from every report hand their rows to `submit()`. A writer
+    thread accumulates them and flushes with one multi-row INSERT once
+    `flush_rows` rows are pending or `flush_ms` has passed since the first
+    pending row. Each submit's Future resolves (with its row count) only
+    after the transaction holding its rows has committed. An image's
+    processing checkpoint (`image_id`) is committed in that same transaction.
+    A failed group is retried once, then written image by image so only
+    the images whose rows are bad fail.
+    """
+
+    def __init__(self, flush_rows=INFERENCE_WRITER_FLUSH_ROWS, flush_ms=INFERENCE_WRITER_FLUSH_MS):
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="inference_writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows, image_id=None):
+        """Queue rows (dicts of Inference columns); the Future acks durability."""
+        future = Future()
+        if not rows:
+            future.set_result(0)
+            return future
+        self._queue.put((list(rows), image_id, future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            pending = len(item[0])
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while pending < self.flush_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                pending += len(item[0])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rows = [row for rows, _, _ in batch for row in rows]
+        done_image_ids = [image_id for _, image_id, _ in batch if image_id is not None]
+        try:
+            self._insert_with_retry(rows, done_image_ids)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Inference writer: failed to write {len(rows)} rows: {str(e)}")
+                batch[0][2].set_exception(e)
+                return
+            # One bad row (or a persistent error) must not fail every image in
+            # the group: fall back to one transaction per image
+            logger.warning(f"Inference writer: group of {len(batch)} images failed ({str(e)}); "
+                           f"writing them one by one")
+            for item in batch:
+                self._flush([item])
+            return
+        logger.info(f"✅ Inference writer: committed {len(rows)} rows from {len(batch)} images")
+        for image_rows, _, future in batch:
+            future.set_result(len(image_rows))
+
+    @staticmethod
+    def _insert_with_retry(rows, done_image_ids):
+        """insert_inferences, retried once (e.g. a deadlock or dropped connection)."""
+        try:
+            insert_inferences(rows, done_image_ids)
+        except Exception as e:
+            logger.warning(f"Inference writer: retrying write of {len(rows)} rows: {str(e)}")
+            insert_inferences(rows, done_image_ids)
+
+    def shutdown(self):
+        """Flush whatever is pending and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_inference_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = InferenceWriter()
+        return _writer
+
+
+def shutdown_inference_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            logger.info("Shutting down inference writer...")
+            _writer.shutdown()
+            _writer = None
@@ -1,40 +1,174 @@
 import os
-import boto3
+import time
 import uuid
+import logging
+import threading
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from datetime import datetime
 from dotenv import load_dotenv
- 
+from backend.services.image_buffer import ImageBuffer
+from app.config import (
+    S3_MAX_POOL_CONNECTIONS, S3_MULTIPART_THRESHOLD, S3_MULTIPART_CHUNKSIZE,
+    S3_TRANSFER_CONCURRENCY, S3_UPLOAD_RETRIES, S3_RETRY_BACKOFF, S3_ENDPOINT_URL
+)
+
+logger = logging.getLogger(__name__)
+
 # Load variables from .env file
 load_dotenv()
- 
-# Set AWS credentials directly from environment variables
-os.environ["AWS_ACCESS_KEY_ID"] = os.getenv("aws_access_key_id")
-os.environ["AWS_SECRET_ACCESS_KEY"] = os.getenv("aws_secret_access_key")
-os.environ["AWS_DEFAULT_REGION"] = os.getenv("region_name")
- 
+
+# Set AWS credentials from environment variables when provided
+# (a local stand-in such as moto/MinIO may supply its own)
+for env_key, dotenv_key in (
+    ("AWS_ACCESS_KEY_ID", "aws_access_key_id"),
+    ("AWS_SECRET_ACCESS_KEY", "aws_secret_access_key"),
+    ("AWS_DEFAULT_REGION", "region_name"),
+):
+    if os.getenv(dotenv_key):
+        os.environ[env_key] = os.getenv(dotenv_key)
+
 # Constants
 BUCKET_NAME = os.getenv("s3_bucket_name")
 S3_BASE_FOLDER = "uploads"
- 
-def upload_images(image_path):
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    s3_folder = f"{S3_BASE_FOLDER}/"
-    s3 = boto3.client('s3')
-    image_name = os.path.basename(image_path)
 
-    s3_key = s3_folder + f"uncompressed_{timestamp}_{str(uuid.uuid1())}_{image_name}"
-    try:
-        s3.upload_file(image_path, BUCKET_NAME, s3_key)
+
+class S3UploadError(Exception):
+    """Raised when an image could not be uploaded after all retries"""
+
+
+class S3Uploader:
+    """
+    App-wide S3 uploader: one client (boto3 clients are thread-safe) whose
+    connection pool is sized to pipeline concurrency, an explicit multipart
+    TransferConfig, retry with exponential backoff, and per-upload metrics.
+    """
+
+    def __init__(self, bucket=BUCKET_NAME, endpoint_url=S3_ENDPOINT_URL):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 3, "mode": "standard"},
+                signature_version="s3v4",  # required for presigned multipart part URLs
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_TRANSFER_CONCURRENCY,
+            use_threads=True,
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {"uploads": 0, "failures": 0, "retries": 0, "bytes": 0, "seconds": 0.0}
+
+    def object_url(self, s3_key):
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{s3_key}"
         region = os.getenv("region_name")
-        s3_url = f"https://{BUCKET_NAME}.s3.{region}.amazonaws.com/{s3_key}"
-        # print(f"Uploaded: {image_path} → {s3_url}")
-        return s3_key, s3_url
-    except Exception as e:
-        print(f"Failed to upload {image_name}: {e}")
+        return f"https://{self.bucket}.s3.{region}.amazonaws.com/{s3_key}"
+
+    def _upload_once(self, image, s3_key):
+        if isinstance(image, ImageBuffer):
+            # Stream from the already-mapped bytes instead of re-reading the file
+            with image.reader() as fh:
+                self.client.upload_fileobj(fh, self.bucket, s3_key, Config=self.transfer_config)
+        else:
+            self.client.upload_file(image, self.bucket, s3_key, Config=self.transfer_config)
+
+    def upload(self, image, s3_key):
+        size = image.size if isinstance(image, ImageBuffer) else os.path.getsize(image)
+        delay = S3_RETRY_BACKOFF
+        start = time.perf_counter()
+        for attempt in range(1, S3_UPLOAD_RETRIES + 1):
+            try:
+                self._upload_once(image, s3_key)
+                break
+            except Exception as e:
+                if attempt == S3_UPLOAD_RETRIES:
+                    with self._stats_lock:
+                        self.stats["failures"] += 1
+                    raise S3UploadError(f"Failed to upload {s3_key} after {attempt} attempts: {e}") from e
+                logger.warning(f"S3 upload of {s3_key} failed (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats["uploads"] += 1
+            self.stats["bytes"] += size
+            self.stats["seconds"] += elapsed
+        logger.info(f"S3 upload {s3_key}: {size} bytes in {elapsed * 1000:.0f} ms")
+        return self.object_url(s3_key)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    # ---------- direct (browser) multipart uploads ----------
+
+    def create_multipart(self, s3_key, content_type=None):
+        extra = {"ContentType": content_type} if content_type else {}
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=s3_key, **extra)["UploadId"]
+
+    def presign_part(self, s3_key, upload_id, part_number, expires_in):
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": self.bucket, "Key": s3_key, "UploadId": upload_id, "PartNumber": part_number},
+            ExpiresIn=expires_in,
+        )
+
+    def complete_multipart(self, s3_key, upload_id, parts):
+        """`parts` is [(part_number, etag), ...] as reported by the browser."""
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": n, "ETag": etag} for n, etag in sorted(parts)]},
+        )
+
+    def abort_multipart(self, s3_key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id)
+
+    def download(self, s3_key, path):
+        """Fetch an object to a local file for the pipeline."""
+        self.client.download_file(self.bucket, s3_key, path, Config=self.transfer_config)
+
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+
+def get_uploader():
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = S3Uploader()
+        return _uploader
+
+
+def upload_images(image):
+    """
+    Upload one image to S3 and return (s3_key, s3_url).
+    `image` is an ImageBuffer shared with the other stages, or a file path.
+    Raises S3UploadError when every retry fails.
+    """
+    image_name = image.name if isinstance(image, ImageBuffer) else os.path.basename(image)
+    s3_key = make_object_key(image_name)
+    s3_url = get_uploader().upload(image, s3_key)
+    return s3_key, s3_url
+
+
+def make_object_key(image_name):
+    """S3 key for an uploaded image, unique per upload."""
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    s3_folder = f"{S3_BASE_FOLDER}/"
+    return s3_folder + f"uncompressed_{timestamp}_{str(uuid.uuid1())}_{image_name}"
 
 if __name__ == "__main__":
     s3_key, s3_url = upload_images("./testing images/debug/DJI_0485.JPG")
     print(s3_url)
-            
- 
- 
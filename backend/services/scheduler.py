@@ -0,0 +1,374 @@
+# backend/services/scheduler.py
+
+import os
+import shutil
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.config import SCHEDULER_MAX_IMAGES_IN_FLIGHT, SCHEDULER_MAX_ACTIVE_REPORTS, ALLOWED_IMAGE_EXTENSIONS
+from backend.services.pipeline import ImageJob, get_pipeline, get_pipeline_counters
+from backend.services.data_manager import (
+    create_processing_job, add_processing_image, mark_images_failed, finish_processing_job,
+    get_unfinished_jobs
+)
+from backend.models.processing_job import STATUS_DONE, STATUS_FAILED
+from backend.services.progress import progress_bus
+
+logger = logging.getLogger(__name__)
+
+class SchedulerFullError(Exception):
+    """Raised when the admission queue already holds the maximum number of reports"""
+
+
+class ReportRun:
+    """
+    One admitted report. `images` are the images still to process, as
+    (image_id, position, image_path, content_hash) tuples backed by
+    processing_images rows. A resumed report passes its full `total` and
+    the counts already finished before the restart.
+    An unsealed run (`sealed=False`) is still receiving images from a
+    streaming upload and cannot finish until `seal_report()` is called.
+    `future` resolves to (success, images_processed, total_results) once
+    every image is done.
+    """
+
+    def __init__(self, report_dir, report_id, user_id, job_id, images, total=None, completed=0, failed=0,
+                 sealed=True):
+        self.report_dir = report_dir
+        self.report_id = report_id
+        self.user_id = user_id
+        self.job_id = job_id
+        self.pending = deque(images)
+        self.total = len(images) if total is None else total
+        self.completed = completed
+        self.failed = failed
+        self.total_results = 0
+        self.sealed = sealed
+        self.s3_keys = {}  # image_path -> S3 key for images the browser uploaded directly
+        self.queued = False  # in the scheduler's per-user queues
+        self.future = Future()
+
+    @property
+    def finished(self):
+        return self.sealed and self.completed + self.failed == self.total
+
+
+def list_report_images(report_dir):
+    return sorted(
+        os.path.join(report_dir, name)
+        for name in os.listdir(report_dir)
+        if name.lower().endswith(ALLOWED_IMAGE_EXTENSIONS)
+    )
+
+
+class ReportScheduler:
+    """
+    Single admission point for report processing from every endpoint.
+    Every admitted report is persisted as a processing job with one row per
+    image, so `resume_unfinished()` can pick up after a restart.
+
+    - A global budget caps images in flight across all reports
+    - Users take turns (round-robin): each turn dispatches one image from
+      that user's oldest report, so a 1,000-image report cannot starve
+      another user's 10-image report
+    - At most `max_active_reports` reports are admitted at once
+    """
+
+    def __init__(self, max_images_in_flight=SCHEDULER_MAX_IMAGES_IN_FLIGHT,
+                 max_active_reports=SCHEDULER_MAX_ACTIVE_REPORTS):
+        self.max_images_in_flight = max_images_in_flight
+        self.max_active_reports = max_active_reports
+        self._cond = threading.Condition()
+        self._user_reports = {}     # user_id -> deque of ReportRun with pending images
+        self._rotation = deque()    # user_ids waiting for their next turn
+        self._active_reports = 0
+        self._runs = {}             # report_id -> active ReportRun, for progress snapshots
+        self._in_flight = 0
+        self._stopping = False
+        # Finished reports are cleaned up here (folder removal, job update), not on
+        # the inference writer thread that resolves their last image
+        self._cleanup = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report_cleanup")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="report_scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def submit_report(self, report_dir, report_id, user_id, content_hashes=None):
+        """
+        Admit a report for processing and return its ReportRun.
+        Raises SchedulerFullError (and removes the report folder) when full.
+        """
+        image_paths = list_report_images(report_dir)
+        if not image_paths:
+            logger.warning(f"No image files found in {report_dir} for user {user_id}")
+            run = ReportRun(report_dir, report_id, user_id, None, [])
+            self._finish(run)
+            return run
+
+        with self._cond:
+            if self._active_reports >= self.max_active_reports:
+                shutil.rmtree(report_dir, ignore_errors=True)
+                raise SchedulerFullError(f"{self._active_reports} reports are already queued or processing")
+            self._active_reports += 1
+
+        try:
+            job_id, images = create_processing_job(report_id, user_id, report_dir, image_paths, content_hashes)
+        except Exception:
+            with self._cond:
+                self._active_reports -= 1
+            raise
+        run = ReportRun(report_dir, report_id, user_id, job_id, images)
+        self._enqueue(run)
+
+        logger.info(f"User {user_id}: Report {report_id} admitted with {run.total} images (job {job_id})")
+        return run
+
+    def open_report(self, report_dir, report_id, user_id):
+        """
+        Admit a report whose images are still being uploaded. Add each one
+        with `add_image()` as soon as it is on disk, then `seal_report()`.
+        Raises SchedulerFullError when full.
+        """
+        with self._cond:
+            if self._active_reports >= self.max_active_reports:
+                raise SchedulerFullError(f"{self._active_reports} reports are already queued or processing")
+            self._active_reports += 1
+
+        try:
+            job_id, _ = create_processing_job(report_id, user_id, report_dir, [])
+        except Exception:
+            with self._cond:
+                self._active_reports -= 1
+            raise
+        run = ReportRun(report_dir, report_id, user_id, job_id, [], sealed=False)
+        with self._cond:
+            self._runs[report_id] = run
+
+        logger.info(f"User {user_id}: Report {report_id} opened for streaming upload (job {job_id})")
+        return run
+
+    def add_image(self, run, image_path, content_hash=None, s3_key=None):
+        """
+        Queue one fully written image of an open report for processing.
+        `s3_key` marks an image that is already in S3, so it is not uploaded again.
+        """
+        with self._cond:
+            run.total += 1
+            position = run.total
+            if s3_key:
+                run.s3_keys[image_path] = s3_key
+        image_id = add_processing_image(run.job_id, position, image_path, content_hash)
+        with self._cond:
+            run.pending.append((image_id, position, image_path, content_hash))
+            if not run.queued:
+                self._queue_run(run)
+            self._cond.notify_all()
+
+    def seal_report(self, run):
+        """No more images will be added; the report finishes once they are processed."""
+        with self._cond:
+            run.sealed = True
+            finished = run.finished
+            if finished:
+                self._active_reports -= 1
+        logger.info(f"Report {run.report_id}: upload complete with {run.total} images")
+        if finished:
+            self._finish(run)
+
+    def resume_unfinished(self):
+        """
+        Re-claim jobs left running by a previous process (restart, deploy)
+        and re-queue only their images that never reached done/failed.
+        """
+        resumed = 0
+        for job, images in get_unfinished_jobs():
+            remaining, missing = [], []
+            for img in images:
+                if img.status in (STATUS_DONE, STATUS_FAILED):
+                    continue
+                entry = (img.id, img.position, img.image_path, img.content_hash)
+                (remaining if os.path.exists(img.image_path) else missing).append(entry)
+            if missing:
+                logger.warning(f"Report {job.report_id}: {len(missing)} images missing on disk, marking failed")
+                mark_images_failed([entry[0] for entry in missing])
+
+            run = ReportRun(
+                job.report_dir, job.report_id, job.user_id, job.id, remaining,
+                total=len(images),
+                completed=sum(1 for img in images if img.status == STATUS_DONE),
+                failed=sum(1 for img in images if img.status == STATUS_FAILED) + len(missing),
+            )
+            if not remaining:
+                self._finish(run)
+                continue
+            with self._cond:
+                self._active_reports += 1
+            self._enqueue(run)
+            resumed += 1
+            logger.info(f"Report {job.report_id}: resumed with {len(remaining)}/{len(images)} images left")
+        if resumed:
+            logger.info(f"Resumed {resumed} unfinished report(s)")
+        return resumed
+
+    def _enqueue(self, run):
+        with self._cond:
+            self._runs[run.report_id] = run
+            self._queue_run(run)
+            self._cond.notify_all()
+
+    def _queue_run(self, run):
+        """Put a run with pending images in its user's queue. Caller holds the lock."""
+        run.queued = True
+        self._user_reports.setdefault(run.user_id, deque()).append(run)
+        if run.user_id not in self._rotation:
+            self._rotation.append(run.user_id)
+
+    def report_progress(self, report_id):
+        """Snapshot of an active report's progress, or None if it is not processing."""
+        with self._cond:
+            run = self._runs.get(report_id)
+            if run is None:
+                return None
+            return self._progress(run)
+
+    @staticmethod
+    def _progress(run):
+        return {
+            "report_id": run.report_id,
+            "total": run.total,
+            "completed": run.completed,
+            "failed": run.failed,
+            "total_results": run.total_results,
+        }
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active_reports": self._active_reports,
+                "images_in_flight": self._in_flight,
+                "users_waiting": len(self._rotation),
+                "images_pending": sum(len(r.pending) for runs in self._user_reports.values() for r in runs),
+            }
+
+    def _next_image(self):
+        """Pick the next image round-robin across users. Caller holds the lock."""
+        user_id = self._rotation.popleft()
+        runs = self._user_reports[user_id]
+        run = runs[0]
+        image = run.pending.popleft()
+        if not run.pending:
+            # An open report is queued again by add_image() when more arrive
+            runs.popleft()
+            run.queued = False
+        if runs:
+            self._rotation.append(user_id)
+        else:
+            del self._user_reports[user_id]
+        return run, image
+
+    def _dispatch_loop(self):
+        pipeline = get_pipeline()
+        while True:
+            with self._cond:
+                while not self._stopping and (
+                    not self._rotation or self._in_flight >= self.max_images_in_flight
+                ):
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                run, (image_id, idx, image_path, content_hash) = self._next_image()
+                self._in_flight += 1
+
+            job = ImageJob(image_path, run.report_id, run.user_id, idx, run.total, content_hash, image_id,
+                           s3_key=run.s3_keys.get(image_path))
+            future = pipeline.submit(job)
+            future.add_done_callback(lambda f, run=run, job=job: self._image_done(run, job, f))
+
+    def _image_done(self, run, job, future):
+        success, count = future.result()
+        if not success:
+            # Successful images are checkpointed together with their inference rows
+            try:
+                mark_images_failed([job.image_id])
+            except Exception as e:
+                logger.error(f"Report {run.report_id}: could not checkpoint failed image {job.image_id}: {str(e)}")
+        with self._cond:
+            self._in_flight -= 1
+            if success:
+                run.completed += 1
+                run.total_results += count
+            else:
+                run.failed += 1
+            finished = run.finished
+            if finished:
+                self._active_reports -= 1
+            progress = self._progress(run)
+            self._cond.notify_all()
+
+        # Push the image and its freshly written rows to live viewers
+        progress.update({
+            "image_name": job.name,
+            "position": job.idx,
+            "success": success,
+            "detection_pass": job.detection_pass,
+            "inferences": [
+                {key: row[key] for key in ("unique_id", "vin_no", "quantity", "image_name", "exclusion", "s3_obj_url")}
+                for row in job.rows
+            ] if success else [],
+        })
+        progress_bus.publish(run.report_id, "image", progress)
+        if finished:
+            try:
+                self._cleanup.submit(self._finish, run)
+            except RuntimeError:
+                # Scheduler already shut down while the pipeline drains
+                self._finish(run)
+
+    def _finish(self, run):
+        logger.info(f"User {run.user_id}: Completed {run.completed}/{run.total} images, {run.total_results} total results")
+        logger.info(f"Report {run.report_id}: Processing complete - {run.completed} images, {run.total_results} results")
+        logger.info(f"Pipeline counters: {get_pipeline_counters()}")
+        # Clean up the uploaded folder after processing completes
+        if os.path.exists(run.report_dir):
+            try:
+                shutil.rmtree(run.report_dir)
+                logger.info(f"Cleaned up processed folder: {run.report_dir}")
+            except Exception as e:
+                logger.error(f"Error cleaning up folder {run.report_dir}: {str(e)}")
+        if run.job_id is not None:
+            try:
+                finish_processing_job(run.job_id)
+            except Exception as e:
+                logger.error(f"Report {run.report_id}: could not mark job {run.job_id} done: {str(e)}")
+        with self._cond:
+            self._runs.pop(run.report_id, None)
+        progress_bus.publish(run.report_id, "done", self._progress(run))
+        run.future.set_result((run.failed == 0, run.completed, run.total_results))
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._cleanup.shutdown(wait=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReportScheduler()
+        return _scheduler
+
+
+def shutdown_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            logger.info("Shutting down report scheduler...")
+            _scheduler.shutdown()
+            _scheduler = None
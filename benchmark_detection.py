@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Detection Backend Benchmark
+Checks that every backend makes the same Empty-Skid decisions as the
+PyTorch model on a folder of sample images, and compares their latency.
+
+Usage: python benchmark_detection.py <image_folder> [--backends torch onnx openvino] [--repeat 3]
+Exits with status 1 if any backend disagrees with torch on any image.
+"""
+import sys
+import os
+import time
+import argparse
+import statistics
+sys.path.append(os.path.dirname(__file__))
+
+from backend.services import detection
+
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
+
+
+def time_backend(backend, image_paths, repeat):
+    """Run every image through `backend` one at a time; returns (decisions, latencies in ms)."""
+    detection.get_model(backend)
+    # Warm-up run so lazy initialisation is not counted
+    detection.detect_vehicles(image_paths[:1], backend)
+
+    decisions, latencies = {}, []
+    for _ in range(repeat):
+        for path in image_paths:
+            start = time.perf_counter()
+            result = detection.detect_vehicles([path], backend)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            decisions[path] = result.found
+    return decisions, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection backend parity and latency check")
+    parser.add_argument("image_folder")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=detection.BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        os.path.join(args.image_folder, name)
+        for name in os.listdir(args.image_folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not image_paths:
+        print(f"❌ No images found in {args.image_folder}")
+        return 1
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+
+    print("\n" + "=" * 70)
+    print(f"DETECTION BACKEND BENCHMARK - {len(image_paths)} images x {args.repeat}")
+    print("=" * 70)
+
+    results = {}
+    for backend in backends:
+        print(f"\n⏳ {backend}: {detection.export_model(backend)}")
+        results[backend] = time_backend(backend, image_paths, args.repeat)
+
+    reference, reference_latencies = results["torch"]
+    reference_mean = statistics.mean(reference_latencies)
+    mismatched = False
+
+    print(f"\n{'backend':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}{'mismatches':>12}")
+    print("-" * 62)
+    for backend in backends:
+        decisions, latencies = results[backend]
+        ordered = sorted(latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        mean = statistics.mean(latencies)
+        mismatches = [p for p in image_paths if decisions[p] != reference[p]]
+        mismatched = mismatched or bool(mismatches)
+        print(f"{backend:<10}{mean:>10.1f}{statistics.median(latencies):>10.1f}{p95:>10.1f}"
+              f"{reference_mean / mean:>9.2f}x{len(mismatches):>12}")
+        for path in mismatches:
+            print(f"   ❌ {os.path.basename(path)}: torch={'Chassis' if reference[path] else 'Empty Skid'}, "
+                  f"{backend}={'Chassis' if decisions[path] else 'Empty Skid'}")
+
+    if mismatched:
+        print("\n❌ Parity check FAILED: Empty-Skid decisions differ from torch")
+        return 1
+    print("\n✅ Parity check passed: all backends make identical Empty-Skid decisions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+OCR Batching Check
+Runs OCRClient against the fake Vision annotator (no credentials needed),
+one image at a time and in batch mode, from many threads at once. Checks
+that every caller gets back its own image's result (and that a per-image
+error only fails that image), and reports RPC counts, batch sizes and time.
+
+Usage: python benchmark_ocr_batching.py [--images 64] [--threads 32] [--rpc-ms 150] [--image-ms 20] [--grpc]
+--grpc serves the fake over gRPC and connects through VISION_EMULATOR_HOST
+instead of injecting the client. Exits with status 1 on any wrong result.
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(__file__))
+
+import cv2
+import numpy as np
+
+GRPC_ADDRESS = "localhost:50151"
+
+
+def make_images(folder, count, seed=11):
+    """Small distinct JPEGs, so the OCR client sends their bytes as-is."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        image = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        path = os.path.join(folder, f"image_{i:03d}.jpg")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def run(ocr_client, paths, threads, expected):
+    """OCR every path from `threads` threads; returns (seconds, wrong results, errors)."""
+    def one(path):
+        try:
+            annotations = ocr_client.get_annotations(path)
+            return path, annotations[0].description, None
+        except Exception as e:
+            return path, None, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(one, paths))
+    elapsed = time.perf_counter() - start
+    wrong = [path for path, text, error in results if error is None and text != expected[path]]
+    errors = [path for path, _, error in results if error is not None]
+    return elapsed, wrong, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR batching check against a fake Vision endpoint")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rpc-ms", type=int, default=150, help="fake latency per call")
+    parser.add_argument("--image-ms", type=int, default=20, help="fake latency per image")
+    parser.add_argument("--grpc", action="store_true", help="go through VISION_EMULATOR_HOST")
+    args = parser.parse_args()
+
+    if args.grpc:
+        # Read by app.config at import time
+        os.environ["VISION_EMULATOR_HOST"] = GRPC_ADDRESS
+    from backend.services.fake_vision import FakeImageAnnotator, FakeVisionClient, fake_unique_id, serve
+    from backend.services.google_ocr import OCRClient
+
+    folder = tempfile.mkdtemp(prefix="ocr_batching_")
+    paths = make_images(folder, args.images)
+    expected = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            expected[path] = fake_unique_id(f.read())
+    # The first image gets a per-image error: only it may fail
+    failing = paths[0]
+    annotator = FakeImageAnnotator(args.rpc_ms, args.image_ms, fail_ids=[expected[failing]])
+    server = serve(GRPC_ADDRESS, annotator) if args.grpc else None
+
+    print("\n" + "=" * 70)
+    print(f"OCR BATCHING CHECK - {args.images} images, {args.threads} threads, "
+          f"{'gRPC endpoint' if args.grpc else 'in-process client'}")
+    print("=" * 70)
+    print(f"{'mode':<8}{'seconds':>9}{'RPCs':>7}{'batch sizes':>30}{'wrong':>7}{'errors':>8}")
+    print("-" * 69)
+
+    ok = True
+    try:
+        for batch_mode in (False, True):
+            annotator.calls.clear()
+            client = None if args.grpc else FakeVisionClient(annotator)
+            ocr_client = OCRClient(client=client, batch_mode=batch_mode, progressive=False)
+            elapsed, wrong, errors = run(ocr_client, paths, args.threads, expected)
+            sizes = ", ".join(f"{size}x{n}" for size, n in sorted(Counter(annotator.calls).items(), reverse=True))
+            print(f"{'batch' if batch_mode else 'single':<8}{elapsed:>9.2f}{len(annotator.calls):>7}"
+                  f"{sizes:>30}{len(wrong):>7}{len(errors):>8}")
+            ok = ok and not wrong and errors == [failing]
+    finally:
+        if server is not None:
+            server.stop(0)
+
+    print("=" * 70)
+    print("✅ Every image got its own result" if ok else "❌ Results were mixed up or lost")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
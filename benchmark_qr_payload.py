@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+QR Payload Benchmark
+Compares the legacy and compact sticker payloads: QR size in modules,
+decode success and scans/sec when the sticker's QR spans a given number
+of pixels in the frame (as it would in a drone image of the rack).
+
+Usage: python benchmark_qr_payload.py [--qr-pixels 60 90 120 180] [--samples 50] [--frame 1600]
+"""
+import sys
+import os
+import time
+import random
+import string
+import argparse
+sys.path.append(os.path.dirname(__file__))
+
+import cv2
+import numpy as np
+import qrcode
+
+from backend.services.qr_payload import encode_payload
+from backend.services.qr_decoder import QRDecoder
+
+VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"  # VINs never use I, O or Q
+
+
+def sample_stickers(count, seed=7):
+    rng = random.Random(seed)
+    stickers = []
+    for _ in range(count):
+        vin = "".join(rng.choice(VIN_CHARS) for _ in range(17))
+        uid = "@" + "".join(rng.choice(string.ascii_uppercase) for _ in range(2)) + f"{rng.randint(1111, 9999)}"
+        stickers.append((vin, uid))
+    return stickers
+
+
+def render_frame(payload, qr_pixels, frame_size):
+    """A grey frame with the sticker QR (same settings as draw_qr_page) scaled to `qr_pixels`."""
+    qr = qrcode.QRCode(box_size=10, border=1)
+    qr.add_data(payload)
+    qr.make()
+    modules = qr.modules_count
+    img = np.array(qr.make_image(fill_color="black", back_color="white").convert("RGB"))[:, :, ::-1]
+    img = cv2.resize(img, (qr_pixels, qr_pixels), interpolation=cv2.INTER_AREA)
+    frame = np.full((frame_size, frame_size, 3), 128, dtype=np.uint8)
+    offset = (frame_size - qr_pixels) // 2
+    frame[offset:offset + qr_pixels, offset:offset + qr_pixels] = img
+    return frame, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs compact QR payload benchmark")
+    parser.add_argument("--qr-pixels", type=int, nargs="+", default=[60, 90, 120, 180])
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--frame", type=int, default=1600, help="frame edge in pixels")
+    args = parser.parse_args()
+
+    decoder = QRDecoder()
+    stickers = sample_stickers(args.samples)
+
+    print("\n" + "=" * 70)
+    print(f"QR PAYLOAD BENCHMARK - {args.samples} stickers, {args.frame}px frames")
+    print("=" * 70)
+    print(f"{'format':<8}{'qr px':>7}{'modules':>9}{'chars':>7}{'decoded':>10}{'scans/s':>10}")
+    print("-" * 51)
+    for qr_pixels in args.qr_pixels:
+        for payload_format in ("legacy", "compact"):
+            frames, modules, chars = [], set(), 0
+            for vin, uid in stickers:
+                payload = encode_payload(vin, uid, payload_format)
+                frame, count = render_frame(payload, qr_pixels, args.frame)
+                frames.append((frame, uid, vin))
+                modules.add(count)
+                chars += len(payload)
+
+            decoded = 0
+            start = time.perf_counter()
+            for frame, uid, vin in frames:
+                results = decoder.decode(frame)
+                decoded += any(r.unique_id == uid and r.vin_no == vin for r, _ in results)
+            elapsed = time.perf_counter() - start
+
+            print(f"{payload_format:<8}{qr_pixels:>7}{'/'.join(map(str, sorted(modules))):>9}"
+                  f"{chars / len(frames):>7.0f}{decoded / len(frames):>9.0%}{len(frames) / elapsed:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
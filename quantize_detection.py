@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+INT8 Detection Model Builder
+Quantizes the chassis detector for CPU and gates it against the FP32 model.
+
+Usage:
+  python quantize_detection.py calibrate <rack_image_folder> [--mode static|dynamic] [--limit 200]
+  python quantize_detection.py gate <rack_image_folder>
+
+`calibrate` writes the INT8 ONNX model next to the .pt weights.
+`gate` compares it with the FP32 model on the "Chassis" class and on
+the per-image AREA_THERSHOLD (Empty Skid) decision, writes the gate
+report, and exits with status 1 if any drift exceeds DETECTION_INT8_MAX_DRIFT.
+Setting DETECTION_BACKEND=onnx-int8 only works once the gate has passed.
+"""
+import sys
+import os
+import json
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(__file__))
+
+import cv2
+import numpy as np
+import onnx
+from ultralytics import YOLO
+
+from app.config import DETECTION_INT8_MAX_DRIFT
+from backend.services import detection
+from backend.services.detection import CONF_THERSHOLD, AREA_THERSHOLD
+
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
+IMGSZ = 640  # input size of the exported ONNX model
+IOU_MATCH = 0.5
+
+
+def list_images(folder, limit=None):
+    paths = sorted(
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def letterbox(image_path):
+    """Same preprocessing ultralytics applies: letterbox to IMGSZ, RGB, CHW, 0-1."""
+    image = cv2.imread(image_path)
+    h, w = image.shape[:2]
+    scale = IMGSZ / max(h, w)
+    resized = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((IMGSZ, IMGSZ, 3), 114, dtype=np.uint8)
+    top = (IMGSZ - resized.shape[0]) // 2
+    left = (IMGSZ - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor[np.newaxis]
+
+
+def calibrate(folder, mode, limit):
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+
+    fp32_path = detection.export_model("onnx")
+    int8_path = detection.backend_model_path("onnx-int8")
+
+    if mode == "dynamic":
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    else:
+        images = list_images(folder, limit)
+        if not images:
+            print(f"❌ No calibration images found in {folder}")
+            return 1
+        input_name = onnx.load(fp32_path).graph.input[0].name
+
+        class RackImageReader(CalibrationDataReader):
+            def __init__(self):
+                self._paths = iter(images)
+
+            def get_next(self):
+                path = next(self._paths, None)
+                return None if path is None else {input_name: letterbox(path)}
+
+        print(f"⏳ Calibrating on {len(images)} rack images...")
+        quantize_static(
+            fp32_path, int8_path, RackImageReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+
+    # Keep the ultralytics metadata (class names, imgsz, stride) on the INT8 model
+    fp32_model, int8_model = onnx.load(fp32_path), onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+
+    # Any previous gate result no longer applies to this build
+    if os.path.exists(detection.gate_report_path()):
+        os.remove(detection.gate_report_path())
+    print(f"✅ INT8 ({mode}) model written to {int8_path}; run the gate before activating it")
+    return 0
+
+
+def chassis_boxes(model, image_path):
+    """Chassis boxes above CONF_THERSHOLD (any area), as (xyxy, area)."""
+    preds = model.predict(image_path, verbose=False)[0]
+    chassis_cls = detection._chassis_class(model)
+    boxes = []
+    for xyxy, conf, cls in zip(preds.boxes.xyxy.tolist(), preds.boxes.conf.tolist(), preds.boxes.cls.tolist()):
+        if int(cls) == chassis_cls and conf >= CONF_THERSHOLD:
+            boxes.append((xyxy, (xyxy[2] - xyxy[0]) * (xyxy[3] - xyxy[1])))
+    return boxes
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def match(reference, candidate):
+    """Greedy IoU matching; returns matched (reference, candidate) pairs."""
+    pairs, used = [], set()
+    for ref in reference:
+        best, best_iou = None, IOU_MATCH
+        for i, cand in enumerate(candidate):
+            overlap = iou(ref[0], cand[0])
+            if i not in used and overlap >= best_iou:
+                best, best_iou = i, overlap
+        if best is not None:
+            used.add(best)
+            pairs.append((ref, candidate[best]))
+    return pairs
+
+
+def precision_recall(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return round(precision, 4), round(recall, 4)
+
+
+def gate(folder):
+    images = list_images(folder)
+    if not images:
+        print(f"❌ No images found in {folder}")
+        return 1
+    int8_path = detection.backend_model_path("onnx-int8")
+    if not os.path.exists(int8_path):
+        print(f"❌ {int8_path} not found; run calibrate first")
+        return 1
+
+    fp32 = detection.get_model("torch")
+    int8 = YOLO(int8_path, task="detect")  # loaded directly: the gate has not passed yet
+
+    box_tp = box_fp = box_fn = 0
+    img_tp = img_fp = img_fn = 0
+    area_flips = 0
+    changed = []
+    for path in images:
+        ref, cand = chassis_boxes(fp32, path), chassis_boxes(int8, path)
+        pairs = match(ref, cand)
+        box_tp += len(pairs)
+        box_fp += len(cand) - len(pairs)
+        box_fn += len(ref) - len(pairs)
+        area_flips += sum(1 for r, c in pairs if (r[1] >= AREA_THERSHOLD) != (c[1] >= AREA_THERSHOLD))
+
+        # The Empty Skid decision: any Chassis box at or above AREA_THERSHOLD
+        ref_found = any(area >= AREA_THERSHOLD for _, area in ref)
+        cand_found = any(area >= AREA_THERSHOLD for _, area in cand)
+        img_tp += ref_found and cand_found
+        img_fp += cand_found and not ref_found
+        img_fn += ref_found and not cand_found
+        if ref_found != cand_found:
+            changed.append(os.path.basename(path))
+
+    box_precision, box_recall = precision_recall(box_tp, box_fp, box_fn)
+    img_precision, img_recall = precision_recall(img_tp, img_fp, img_fn)
+    drift = {
+        "chassis_precision": round(1 - box_precision, 4),
+        "chassis_recall": round(1 - box_recall, 4),
+        "area_decision_precision": round(1 - img_precision, 4),
+        "area_decision_recall": round(1 - img_recall, 4),
+    }
+    failures = [name for name, value in drift.items() if value > DETECTION_INT8_MAX_DRIFT]
+    report = {
+        "model": int8_path,
+        "model_sha256": detection.file_sha256(int8_path),
+        "images": len(images),
+        "chassis": {"precision": box_precision, "recall": box_recall,
+                    "tp": box_tp, "fp": box_fp, "fn": box_fn, "area_flips": area_flips},
+        "area_decision": {"precision": img_precision, "recall": img_recall,
+                          "tp": img_tp, "fp": img_fp, "fn": img_fn, "changed_images": changed},
+        "drift": drift,
+        "max_drift": DETECTION_INT8_MAX_DRIFT,
+        "failures": failures,
+        "passed": not failures,
+        "createdAt": datetime.now().isoformat(),
+    }
+    with open(detection.gate_report_path(), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "=" * 70)
+    print(f"INT8 ACCURACY GATE - {len(images)} images, FP32 as reference")
+    print("=" * 70)
+    print(f"Chassis boxes:   precision {box_precision:.4f}  recall {box_recall:.4f}  "
+          f"(area flips on matched boxes: {area_flips})")
+    print(f"Empty Skid call: precision {img_precision:.4f}  recall {img_recall:.4f}  "
+          f"(changed on {len(changed)} images)")
+    for name in changed:
+        print(f"   ❌ {name}")
+    if failures:
+        print(f"\n❌ Gate FAILED (max drift {DETECTION_INT8_MAX_DRIFT}): {', '.join(failures)}")
+        return 1
+    print("\n✅ Gate passed; DETECTION_BACKEND=onnx-int8 can now be used")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and gate the INT8 chassis detector")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate")
+    cal.add_argument("image_folder")
+    cal.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    cal.add_argument("--limit", type=int, default=200, help="max calibration images")
+    gate_cmd = sub.add_parser("gate")
+    gate_cmd.add_argument("image_folder")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        return calibrate(args.image_folder, args.mode, args.limit)
+    return gate(args.image_folder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,8 @@ from backend.database import Base, engine, SessionLocal
 from backend.models.user_settings import UserSettings
 from backend.models.report import Report
 from backend.models.inference import Inference
+from backend.models.image_result_cache import ImageResultCache
+from backend.models.processing_job import ProcessingJob, ProcessingImage
 from sqlalchemy import text
 
 def create_all_tables():
@@ -32,7 +34,8 @@ def verify_tables():
     print("VERIFYING TABLES")
     print("="*60)
     
-    required_tables = ['user_settings', 'reports', 'inferences']
+    required_tables = ['user_settings', 'reports', 'inferences', 'image_result_cache',
+                       'processing_jobs', 'processing_images']
     
     try:
         with engine.connect() as connection: